@@ -1,15 +1,18 @@
-from flask import Flask, request, jsonify, session
+import click
+from flask import Flask, g, request, jsonify, send_file, session
+from flask.ctx import RequestContext
 from flask_cors import CORS
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from functools import wraps
 from datetime import timedelta, datetime
+from concurrent.futures import ThreadPoolExecutor
 import re
 import os
-import logging
 from dotenv import load_dotenv
 from sqlalchemy import func, case
-
+from sqlalchemy.orm import joinedload, selectinload
+from werkzeug.test import EnvironBuilder
 
 load_dotenv()
 
@@ -26,14 +29,39 @@ from models import (
     EscortRequest,
     UniversitySettings,
     ChatMessage,
+    DeletionJob,
+    Hotspot,
+    JobWatermark,
+    Zone,
 )
-
+from coalesce import coalesced, init_coalescing
+from compression import init_compression
+import db_pool
+import deletion
+import duplicates
+import hotspots
+import ingest
+import logs
+from json_provider import FastJSONProvider
+import queries
+import ranking
+import reaction_buffer
+import recent_feed
+import replicas
+from replicas import read_only
+import schema
+import search
+import tenancy
+import trends
+import uploads
+import zones
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 
-
-logging.basicConfig(level=logging.INFO)
-app.logger.setLevel(logging.INFO)
+# Forks the image workers, so it runs before anything starts a thread
+uploads.start_image_workers()
+logs.init_logging(app)
 
 
 limiter = Limiter(
@@ -47,10 +75,7 @@ limiter = Limiter(
 app.config["SQLALCHEMY_DATABASE_URI"] = os.getenv("DATABASE_URI", "sqlite:///app.db")
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 app.config["SECRET_KEY"] = os.getenv("SECRET_KEY", "your_secret_key")
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_pre_ping": True,
-    "pool_recycle": 300,
-}
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = db_pool.engine_options()
 
 app.config["PERMANENT_SESSION_LIFETIME"] = timedelta(days=7)
 
@@ -88,7 +113,23 @@ CORS(
     allow_headers=["Content-Type", "Authorization", "X-Requested-With"],
 )
 
+replicas.configure(app)
 db.init_app(app)
+tenancy.init_tenancy(app)
+replicas.init_replicas(app, db)
+with app.app_context():
+    db_pool.init_pool_telemetry(db.engines)
+init_compression(app)
+init_coalescing()
+recent_feed.init_recent_feed()
+
+
+# --- BATCH REQUESTS ---
+BATCH_MAX_REQUESTS = int(os.getenv("BATCH_MAX_REQUESTS", "20"))
+batch_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("BATCH_MAX_WORKERS", "4")),
+    thread_name_prefix="batch",
+)
 
 
 @app.before_request
@@ -96,17 +137,35 @@ def make_session_permanent():
     session.permanent = True
 
 
+@app.before_request
+def load_session_role():
+    """Read the user's role as stored now, not as of login.
+
+    Sessions of users that were deleted, or are being deleted, are cleared.
+    """
+    g.role = None
+    user_id = session.get("user_id")
+    if user_id is None:
+        return
+    with tenancy.unscoped():
+        role = db.session.query(User.role).filter_by(id=user_id).scalar()
+    if role is None or role == "deleting":
+        app.logger.info("Cleared stale session", extra={"user_id": user_id})
+        session.clear()
+        return
+    g.role = role
+
+
 #
 def student_required(f):
     @wraps(f)
     def wrapper(*args, **kwargs):
         app.logger.info(
-            f"Student check: session role = {session.get('role')}, user_id = {session.get('user_id')}"
+            "Student check",
+            extra={"role": g.role, "user_id": session.get("user_id")},
         )
-        if session.get("role") != "student":
-            app.logger.warning(
-                f"Access denied: role {session.get('role')} is not student"
-            )
+        if g.role != "student":
+            app.logger.warning("Access denied: not a student", extra={"role": g.role})
             return {"error": "Only students allowed"}, 403
         return f(*args, **kwargs)
 
@@ -116,7 +175,7 @@ def student_required(f):
 def admin_required(f):
     @wraps(f)
     def wrapper(*args, **kwargs):
-        if session.get("role") != "admin":
+        if g.role != "admin":
             return {"error": "Only admins allowed"}, 403
         return f(*args, **kwargs)
 
@@ -127,10 +186,68 @@ def is_valid_email(email):
     return re.match(r"[^@]+@[^@]+\.[^@]+", email)
 
 
+def get_user_reactions(post_ids):
+    """Map post id -> the current user's reaction for a page of posts (one IN query)."""
+    uid = session.get("user_id")
+    if not uid or not post_ids:
+        return {}
+    rows = (
+        db.session.query(Reaction.post_id, Reaction.reaction_type)
+        .filter(Reaction.user_id == uid, Reaction.post_id.in_(post_ids))
+        .all()
+    )
+    reactions = {post_id: reaction_type for post_id, reaction_type in rows}
+    if reaction_buffer.REACTION_WRITE_BEHIND:
+        reaction_buffer.buffer.user_reactions(uid, post_ids, reactions)
+    return reactions
+
+
+COMMENTS_PAGE_SIZE = 20
+COMMENTS_MAX_PAGE_SIZE = 100
+
+
+def parse_comment_cursor(value):
+    """Parse an ``<created_at iso>,<id>`` cursor; raises ValueError if malformed."""
+    created_at, comment_id = value.rsplit(",", 1)
+    return datetime.fromisoformat(created_at), int(comment_id)
+
+
+def get_comments_page(post_id, after=None, limit=COMMENTS_PAGE_SIZE):
+    """Oldest-first page of a post's comments using a (created_at, id) keyset."""
+    # Joining the post keeps other campuses' comments out
+    query = Comment.query.join(Comment.post).filter(Comment.post_id == post_id)
+    if after:
+        created_at, comment_id = after
+        query = query.filter(
+            db.or_(
+                Comment.created_at > created_at,
+                db.and_(Comment.created_at == created_at, Comment.id > comment_id),
+            )
+        )
+    comments = query.order_by(Comment.created_at, Comment.id).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(comments) > limit:
+        comments = comments[:limit]
+        last = comments[-1]
+        next_cursor = f"{last.created_at.isoformat()},{last.id}"
+    data = [
+        {
+            "id": c.id,
+            "content": c.content,
+            "images": uploads.image_urls(c.images),
+            "user_id": c.user_id,
+            "created_at": c.created_at,
+        }
+        for c in comments
+    ]
+    return data, next_cursor
+
+
 @app.route("/auth/signup", methods=["POST"])
 @limiter.limit("5 per minute")
 def signup():
-    app.logger.info(f"Signup attempt from {request.remote_addr}")
+    app.logger.info("Signup attempt", extra={"remote_addr": request.remote_addr})
     try:
         data = request.get_json()
         if not data:
@@ -149,11 +266,13 @@ def signup():
         existing_user = None
         for attempt in range(3):  # Retry up to 3 times
             try:
-                existing_user = User.query.filter_by(email=email).first()
+                # Emails are unique across campuses
+                with tenancy.unscoped():
+                    existing_user = User.query.filter_by(email=email).first()
                 break
             except Exception as db_error:
                 app.logger.warning(
-                    f"Database query attempt {attempt + 1} failed: {str(db_error)}"
+                    "Database query attempt %d failed: %s", attempt + 1, db_error
                 )
                 if attempt == 2:  # Last attempt
                     raise db_error
@@ -173,7 +292,7 @@ def signup():
                 break
             except Exception as db_error:
                 app.logger.warning(
-                    f"Database commit attempt {attempt + 1} failed: {str(db_error)}"
+                    "Database commit attempt %d failed: %s", attempt + 1, db_error
                 )
                 db.session.rollback()
                 if attempt == 2:
@@ -182,26 +301,29 @@ def signup():
 
         session["user_id"] = user.id
         session["role"] = user.role
-        app.logger.info(f"User {email} signed up successfully")
+        session["campus_id"] = user.campus_id
+        app.logger.info("Signed up", extra={"user_id": user.id})
         return {"user": {"id": user.id, "email": user.email, "role": user.role}}, 201
     except Exception as e:
         db.session.rollback()
-        app.logger.error(f"Signup error: {str(e)}")
+        app.logger.error("Signup error: %s", e)
         return {"error": "Database connection error. Please try again."}, 500
 
 
 @app.route("/auth/login", methods=["POST"])
 @limiter.limit("5 per minute")
 def login():
-    app.logger.info(f"Login attempt from {request.remote_addr}")
+    app.logger.info("Login attempt", extra={"remote_addr": request.remote_addr})
     data = request.get_json()
-    user = User.query.filter_by(email=data.get("email")).first()
+    with tenancy.unscoped():
+        user = User.query.filter_by(email=data.get("email")).first()
     if user and user.check_password(data.get("password")):
         session["user_id"] = user.id
         session["role"] = user.role
-        app.logger.info(f"User {user.email} logged in")
+        session["campus_id"] = user.campus_id
+        app.logger.info("Logged in", extra={"user_id": user.id})
         return {"user": {"id": user.id, "email": user.email, "role": user.role}}, 200
-    app.logger.warning(f"Failed login attempt for {data.get('email')}")
+    app.logger.warning("Failed login attempt", extra={"email": data.get("email")})
     return {"error": "Invalid credentials"}, 401
 
 
@@ -235,10 +357,92 @@ def debug_session():
     }
 
 
+def dispatch_subrequest(path, parent_session, base_url, remote_addr, campus=None):
+    """Run one GET sub-request through the normal Flask pipeline.
+
+    The caller's already-decoded session is handed to the sub-request, so
+    identity is not decoded again, and when an app context is active the
+    sub-request shares it (and therefore its DB session and connection).
+    ``campus`` is the caller's campus slug, passed on as ``X-Campus``.
+    """
+    builder = EnvironBuilder(
+        path=path,
+        base_url=base_url,
+        method="GET",
+        headers={"X-Campus": campus} if campus else None,
+        environ_base={"REMOTE_ADDR": remote_addr},
+    )
+    try:
+        environ = builder.get_environ()
+    finally:
+        builder.close()
+
+    try:
+        with RequestContext(app, environ, session=parent_session):
+            response = app.full_dispatch_request()
+    except Exception as e:
+        app.logger.error("Batch sub-request %s failed: %s", path, e)
+        return {"path": path, "status": 500, "body": {"error": "Internal server error"}}
+
+    body = response.get_json(silent=True)
+    if body is None:
+        body = response.get_data(as_text=True)
+    return {"path": path, "status": response.status_code, "body": body}
+
+
+def dispatch_subrequest_in_thread(*args):
+    # Worker threads don't inherit the caller's contexts; each one gets its
+    # own app context (and DB session), removed again on teardown.
+    with app.app_context():
+        return dispatch_subrequest(*args)
+
+
+@app.route("/api/batch", methods=["POST"])
+def batch_requests():
+    """Run several GET endpoints in one round-trip.
+
+    Body: {"requests": ["/api/categories", {"path": "/api/admin/stats"}, ...],
+           "parallel": false}
+    """
+    data = request.get_json(silent=True) or {}
+    items = data.get("requests")
+    if not isinstance(items, list) or not items:
+        return {"error": "A non-empty 'requests' list is required"}, 400
+    if len(items) > BATCH_MAX_REQUESTS:
+        return {"error": f"At most {BATCH_MAX_REQUESTS} requests per batch"}, 400
+
+    paths = []
+    for item in items:
+        path = item.get("path") if isinstance(item, dict) else item
+        if not isinstance(path, str) or not path.startswith("/api/"):
+            return {"error": "Each request needs a path under /api/"}, 400
+        if path.split("?", 1)[0].rstrip("/") == "/api/batch":
+            return {"error": "Batch requests cannot be nested"}, 400
+        paths.append(path)
+
+    args = (
+        session._get_current_object(),
+        request.host_url,
+        request.remote_addr,
+        request.headers.get("X-Campus") or request.args.get("campus"),
+    )
+    if data.get("parallel"):
+        futures = [
+            batch_executor.submit(dispatch_subrequest_in_thread, path, *args)
+            for path in paths
+        ]
+        responses = [f.result() for f in futures]
+    else:
+        responses = [dispatch_subrequest(path, *args) for path in paths]
+
+    return jsonify({"responses": responses})
+
+
 @app.route("/api/categories", methods=["GET"])
+@read_only
 def get_categories():
     try:
-        categories = Category.query.all()
+        categories = Category.query.order_by(Category.id).all()
         return jsonify(
             [
                 {"id": c.id, "name": c.name, "description": c.description}
@@ -246,37 +450,50 @@ def get_categories():
             ]
         )
     except Exception as e:
-        app.logger.error(f"Database error in get_categories: {str(e)}")
+        app.logger.error("Database error in get_categories: %s", e)
         return {"error": "Database connection error. Please try again."}, 500
 
 
 @app.route("/api/posts", methods=["GET"])
+@read_only
 def get_posts():
     try:
         category_id = request.args.get("category_id", type=int)
-        query = Post.query.order_by(Post.created_at.desc())
+        if request.args.get("sort") == "hot":
+            query = Post.query.order_by(Post.hot_score.desc(), Post.id.desc())
+        else:
+            # Served from memory unless the feed can't be loaded
+            page = recent_feed.first_page(tenancy.request_campus_id(), category_id)
+            if page is not None:
+                return jsonify(recent_feed_json(*page))
+            query = Post.query.order_by(Post.created_at.desc())
         if category_id:
             query = query.filter_by(category_id=category_id)
 
-        posts = query.limit(10).all()
+        # Stored counters; category and responses loaded with the page
+        posts = (
+            query.options(joinedload(Post.category), selectinload(Post.admin_responses))
+            .limit(10)
+            .all()
+        )
+        user_reactions = get_user_reactions([p.id for p in posts])
         data = []
         for p in posts:
-            likes = sum(1 for r in p.reactions if r.reaction_type == "like")
-            dislikes = sum(1 for r in p.reactions if r.reaction_type == "dislike")
             admin_response = p.admin_responses[0].content if p.admin_responses else None
             data.append(
                 {
                     "id": p.id,
                     "content": p.content,
-                    "images": p.images,
+                    "images": uploads.image_urls(p.images),
                     "category_id": p.category_id,
-                    "category_name": p.category.name,
+                    "category_name": p.category.name if p.category else None,
                     "user_id": p.user_id,
                     "created_at": p.created_at,
-                    "likes": likes,
-                    "dislikes": dislikes,
-                    "comments_count": len(p.comments),
+                    "likes": p.likes_count,
+                    "dislikes": p.dislikes_count,
+                    "comments_count": p.comments_count,
                     "admin_response": admin_response,
+                    "user_reaction": user_reactions.get(p.id),
                 }
             )
         return jsonify(data)
@@ -284,36 +501,46 @@ def get_posts():
         return {"error": "Internal server error"}, 500
 
 
+def recent_feed_json(records, category_names):
+    user_reactions = get_user_reactions([r.id for r in records])
+    return [
+        {
+            "id": r.id,
+            "content": r.content,
+            "images": r.images,
+            "category_id": r.category_id,
+            "category_name": category_names.get(r.category_id),
+            "user_id": r.user_id,
+            "created_at": r.created_at,
+            "likes": r.likes,
+            "dislikes": r.dislikes,
+            "comments_count": r.comments,
+            "admin_response": r.admin_response,
+            "user_reaction": user_reactions.get(r.id),
+        }
+        for r in records
+    ]
+
+
 @app.route("/api/posts/<int:id>", methods=["GET"])
+@read_only
 def get_post(id):
     post = Post.query.get_or_404(id)
-    likes = sum(1 for r in post.reactions if r.reaction_type == "like")
-    dislikes = sum(1 for r in post.reactions if r.reaction_type == "dislike")
-    user_reaction = None
-    if session.get("user_id"):
-        r = Reaction.query.filter_by(post_id=id, user_id=session["user_id"]).first()
-        if r:
-            user_reaction = r.reaction_type
+    user_reaction = get_user_reactions([post.id]).get(post.id)
+    comments, next_cursor = get_comments_page(post.id)
     return {
         "id": post.id,
         "content": post.content,
-        "images": post.images,
+        "images": uploads.image_urls(post.images),
         "category_id": post.category_id,
         "user_id": post.user_id,
         "created_at": post.created_at,
-        "likes": likes,
-        "dislikes": dislikes,
+        "likes": post.likes_count,
+        "dislikes": post.dislikes_count,
         "user_reaction": user_reaction,
-        "comments": [
-            {
-                "id": c.id,
-                "content": c.content,
-                "images": c.images,
-                "user_id": c.user_id,
-                "created_at": c.created_at,
-            }
-            for c in post.comments
-        ],
+        "comments": comments,
+        "comments_count": post.comments_count,
+        "comments_next_cursor": next_cursor,
         "admin_response": post.admin_responses[0].content
         if post.admin_responses
         else None,
@@ -325,16 +552,49 @@ def create_post():
     data = request.get_json()
     if not data.get("content"):
         return {"error": "Content required"}, 400
-    image = data.get("image")
+    try:
+        image = uploads.normalize(data.get("image"))
+    except uploads.UploadError as e:
+        return {"error": str(e)}, e.status
+    # Categories belong to a campus; default to the campus's first one
+    categories = Category.query.with_entities(Category.id).order_by(Category.id)
+    if data.get("category_id"):
+        categories = categories.filter(Category.id == data["category_id"])
+    category_id = categories.limit(1).scalar()
+    if data.get("category_id") and category_id is None:
+        return {"error": "Category not found"}, 400
+    similar = duplicates.find_similar(data["content"], tenancy.request_campus_id())
     post = Post(
         content=data["content"],
         images=[image] if image else [],
         user_id=session["user_id"],
-        category_id=data.get("category_id", 1),
+        category_id=category_id,
+        hot_score=ranking.hot_score(0, 0, 0, datetime.utcnow()),
+        duplicate_of_id=duplicates.link_target(similar),
     )
     db.session.add(post)
+    db.session.flush()
+    search.index_post(post)
+    recent_feed.post_created(post)
     db.session.commit()
-    return {"id": post.id}, 201
+    duplicates.add(post)
+    return {
+        "id": post.id,
+        "duplicate_of": post.duplicate_of_id,
+        "similar_posts": [similar_post_json(p, score) for p, score in similar],
+    }, 201
+
+
+def similar_post_json(post, similarity):
+    return {
+        "id": post.id,
+        "content": post.content,
+        "category_id": post.category_id,
+        "created_at": post.created_at,
+        "likes": post.likes_count,
+        "comments_count": post.comments_count,
+        "similarity": round(similarity, 3),
+    }
 
 
 @app.route("/api/posts/<int:id>", methods=["DELETE"])
@@ -345,22 +605,109 @@ def delete_post(id):
     post = Post.query.get_or_404(id)
     if post.user_id != user_id:
         return {"error": "You can only delete your own posts"}, 403
-    db.session.delete(post)
+    deletion.delete_posts([post.id])
     db.session.commit()
     return {"message": "Post deleted successfully"}, 200
 
 
+@app.route("/api/images", methods=["POST"])
+@limiter.limit("30 per minute")
+def upload_image():
+    if not session.get("user_id"):
+        return {"error": "Not logged in"}, 401
+    if (request.content_length or 0) > uploads.IMAGE_MAX_BYTES + 64 * 1024:
+        return {"error": "Image is too large"}, 413
+    file = request.files.get("image")
+    data = file.read() if file else request.get_data()
+    if not data:
+        return {"error": "No image uploaded"}, 400
+    try:
+        image_id = uploads.store(data)
+    except uploads.UploadError as e:
+        return {"error": str(e)}, e.status
+    return {
+        "id": image_id,
+        "urls": {v: uploads.image_url(image_id, v) for v in uploads.IMAGE_VARIANTS},
+    }, 201
+
+
+@app.route("/api/images/<image_id>/<variant>", methods=["GET"])
+def get_image(image_id, variant):
+    if not uploads.is_image_id(image_id) or variant not in uploads.IMAGE_VARIANTS:
+        return {"error": "Image not found"}, 404
+    uploads.wait_for(image_id)
+    path = uploads.variant_path(image_id, variant)
+    if not os.path.exists(path):
+        return {"error": "Image not found"}, 404
+    # The URL is derived from the content, so it can be cached forever
+    response = send_file(
+        path,
+        mimetype="image/webp",
+        etag=f"{image_id}-{variant}",
+        max_age=uploads.IMAGE_MAX_AGE,
+    )
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+@app.route("/api/search", methods=["GET"])
+@read_only
+def search_content():
+    q = request.args.get("q", "").strip()
+    if not q:
+        return {"error": "Query parameter 'q' is required"}, 400
+    if not search.is_supported():
+        return {"error": "Search is not available on this database"}, 503
+
+    category_id = request.args.get("category_id", type=int)
+    limit = min(max(request.args.get("limit", 20, type=int), 1), 50)
+    after = None
+    if request.args.get("after"):
+        try:
+            score, doc_id = request.args["after"].split(",")
+            after = (float(score), int(doc_id))
+        except ValueError:
+            return {"error": "Invalid cursor"}, 400
+
+    rows, next_cursor = search.search(q, category_id, after, limit)
+    return jsonify(
+        {
+            "results": [
+                {
+                    "type": r["kind"],
+                    "id": r["ref_id"],
+                    "post_id": r["post_id"],
+                    "category_id": r["category_id"],
+                    "content": r["content"],
+                    "score": r["score"],
+                }
+                for r in rows
+            ],
+            "next_cursor": next_cursor,
+        }
+    )
+
+
 @app.route("/api/comments", methods=["POST"])
 def add_comment():
     data = request.get_json()
-    image = data.get("image")
+    try:
+        image = uploads.normalize(data.get("image"))
+    except uploads.UploadError as e:
+        return {"error": str(e)}, e.status
     comment = Comment(
         content=data["content"],
         images=[image] if image else [],
         post_id=data["post_id"],
         user_id=session.get("user_id"),  # None if anonymous
     )
+    post = Post.query.get_or_404(comment.post_id)
     db.session.add(comment)
+    db.session.flush()
+    search.index_comment(comment, post.category_id)
+    ranking.record_comment(post.id, 1)
+    recent_feed.counts_changed(post.campus_id, [post.id])
     db.session.commit()
     return {"id": comment.id}, 201
 
@@ -370,33 +717,33 @@ def delete_comment(id):
     comment = Comment.query.get_or_404(id)
     if session.get("user_id") != comment.user_id:
         return {"error": "Unauthorized"}, 403
+    search.unindex(comment_ids=[comment.id])
+    ranking.record_comment(comment.post_id, -1)
+    recent_feed.counts_changed(tenancy.request_campus_id(), [comment.post_id])
     db.session.delete(comment)
     db.session.commit()
     return {"message": "Comment deleted"}, 200
 
 
 @app.route("/api/comments/<int:post_id>", methods=["GET"])
+@read_only
 def get_comments(post_id):
-    comments = (
-        Comment.query.filter_by(post_id=post_id).order_by(Comment.created_at).all()
-    )
-    return jsonify(
-        [
-            {
-                "id": c.id,
-                "content": c.content,
-                "images": c.images,
-                "user_id": c.user_id,
-                "created_at": c.created_at,
-            }
-            for c in comments
-        ]
-    )
+    limit = request.args.get("limit", COMMENTS_PAGE_SIZE, type=int)
+    limit = min(max(limit, 1), COMMENTS_MAX_PAGE_SIZE)
+    after = None
+    if request.args.get("after"):
+        try:
+            after = parse_comment_cursor(request.args["after"])
+        except ValueError:
+            return {"error": "Invalid cursor"}, 400
+
+    comments, next_cursor = get_comments_page(post_id, after, limit)
+    return jsonify({"comments": comments, "next_cursor": next_cursor})
 
 
 @app.route("/api/reactions", methods=["POST"])
 def add_reaction():
-    app.logger.info(f"Reaction attempt: session user_id = {session.get('user_id')}")
+    app.logger.info("Reaction attempt", extra={"user_id": session.get("user_id")})
     data = request.get_json()
     post_id = data["post_id"]
     reaction_type = data["reaction_type"]
@@ -404,7 +751,15 @@ def add_reaction():
     if not user_id:
         app.logger.warning("No user_id in session for reaction")
         return {"error": "Not logged in"}, 401
+    if reaction_buffer.REACTION_WRITE_BEHIND:
+        result = reaction_buffer.buffer.toggle(post_id, user_id, reaction_type)
+        if result is None:
+            return {"error": "Post not found"}, 404
+        return result
+    if db.session.query(Post.id).filter(Post.id == post_id).scalar() is None:
+        return {"error": "Post not found"}, 404
     existing = Reaction.query.filter_by(post_id=post_id, user_id=user_id).first()
+    old_type = existing.reaction_type if existing else None
     if existing:
         if existing.reaction_type == reaction_type:
             db.session.delete(existing)
@@ -417,11 +772,17 @@ def add_reaction():
             Reaction(post_id=post_id, user_id=user_id, reaction_type=reaction_type)
         )
         user_reaction = reaction_type
+    ranking.record_reaction(post_id, old_type, user_reaction)
+    recent_feed.counts_changed(tenancy.request_campus_id(), [post_id])
     db.session.commit()
-    reactions = Reaction.query.filter_by(post_id=post_id).all()
+    likes, dislikes = (
+        db.session.query(Post.likes_count, Post.dislikes_count)
+        .filter(Post.id == post_id)
+        .first()
+    ) or (0, 0)
     return {
-        "likes": sum(1 for r in reactions if r.reaction_type == "like"),
-        "dislikes": sum(1 for r in reactions if r.reaction_type == "dislike"),
+        "likes": likes,
+        "dislikes": dislikes,
         "user_reaction": user_reaction,
     }
 
@@ -433,6 +794,7 @@ def respond_post():
     if not data.get("post_id"):
         return {"error": "Post ID is required"}, 400
 
+    Post.query.get_or_404(data["post_id"])
     # Check if response already exists for this post
     existing = AdminResponse.query.filter_by(post_id=data["post_id"]).first()
     if existing:
@@ -442,34 +804,84 @@ def respond_post():
         post_id=data["post_id"], admin_id=session["user_id"], content=data["content"]
     )
     db.session.add(response)
+    Post.query.filter_by(id=data["post_id"]).update(
+        {Post.moderation_status: "responded"}, synchronize_session=False
+    )
+    recent_feed.responded(tenancy.request_campus_id(), data["post_id"], data["content"])
     db.session.commit()
     return {"message": "Admin response saved"}, 201
 
 
 @app.route("/api/admin/posts/pending", methods=["GET"])
 @admin_required
+@read_only
 def pending_posts():
-    posts = Post.query.all()
+    sort = request.args.get("sort", "priority")
+    if sort not in queries.MODERATION_SORTS:
+        return {
+            "error": f"sort must be one of {', '.join(queries.MODERATION_SORTS)}"
+        }, 400
+    limit = min(max(request.args.get("limit", 20, type=int), 1), 100)
+    after = None
+    if request.args.get("after"):
+        try:
+            after = queries.decode_cursor(request.args["after"])
+        except ValueError:
+            return {"error": "Invalid cursor"}, 400
+
+    posts, next_cursor = queries.moderation_queue(sort, after, limit)
     return jsonify(
-        [
-            {"id": p.id, "content": p.content, "created_at": p.created_at}
-            for p in posts
-            if not p.admin_responses
-        ]
+        {
+            "posts": [
+                {
+                    "id": p.id,
+                    "content": p.content,
+                    "created_at": p.created_at,
+                    "category_id": p.category_id,
+                    "likes": p.likes_count,
+                    "dislikes": p.dislikes_count,
+                    "comments_count": p.comments_count,
+                    "priority": p.hot_score,
+                    "duplicate_of": p.duplicate_of_id,
+                }
+                for p in posts
+            ],
+            "next_cursor": next_cursor,
+        }
+    )
+
+
+@app.route("/api/admin/posts/<int:id>/similar", methods=["GET"])
+@admin_required
+@read_only
+def similar_posts(id):
+    if not duplicates.is_enabled():
+        return {"error": "Duplicate detection is not available"}, 503
+    post = Post.query.get_or_404(id)
+    limit = min(max(request.args.get("limit", 10, type=int), 1), 50)
+    similar = duplicates.find_similar(post.content, post.campus_id, post.id, limit)
+    return jsonify(
+        {
+            "post_id": post.id,
+            "duplicate_of": post.duplicate_of_id,
+            "similar_posts": [similar_post_json(p, score) for p, score in similar],
+        }
     )
 
 
 @app.route("/api/analytics/categories")
+@read_only
 def category_chart():
     return jsonify(
         [
             {"name": c.name, "count": Post.query.filter_by(category_id=c.id).count()}
-            for c in Category.query.all()
+            for c in Category.query.order_by(Category.id).all()
         ]
     )
 
 
 @app.route("/api/analytics/votes")
+@read_only
 def votes_chart():
     posts = Post.query.all()
     return jsonify(
@@ -485,11 +897,13 @@ def votes_chart():
 
 
 @app.route("/api/analytics")
+@coalesced()
+@read_only
 def get_analytics():
     """Combined analytics endpoint for dashboard"""
     categories_data = [
         {"name": c.name, "count": Post.query.filter_by(category_id=c.id).count()}
-        for c in Category.query.all()
+        for c in Category.query.order_by(Category.id).all()
     ]
 
     posts = Post.query.all()
@@ -507,6 +921,8 @@ def get_analytics():
 
 @app.route("/api/admin/stats")
 @admin_required
+@coalesced()
+@read_only
 def admin_stats():
     # Real user counts
     total_users = User.query.count()
@@ -515,7 +931,7 @@ def admin_stats():
 
     # Real post counts
     total_posts = Post.query.count()
-    pending_posts = Post.query.filter(~Post.admin_responses.any()).count()
+    pending_posts = Post.query.filter_by(moderation_status="pending").count()
     responded_posts = total_posts - pending_posts
 
     # Real security reports
@@ -532,8 +948,8 @@ def admin_stats():
     ).count()
 
     # Real comments and reactions
-    total_comments = Comment.query.count()
-    total_reactions = Reaction.query.count()
+    total_comments = Comment.query.join(Comment.post).count()
+    total_reactions = Reaction.query.join(Reaction.post).count()
 
     # Top category
     top_category_data = (
@@ -565,9 +981,11 @@ def admin_stats():
     # Recent activity (last 7 days)
     seven_days_ago = datetime.utcnow() - timedelta(days=7)
     recent_posts = Post.query.filter(Post.created_at >= seven_days_ago).count()
-    recent_responses = AdminResponse.query.filter(
-        AdminResponse.created_at >= seven_days_ago
-    ).count()
+    recent_responses = (
+        AdminResponse.query.join(AdminResponse.post)
+        .filter(AdminResponse.created_at >= seven_days_ago)
+        .count()
+    )
     recent_reports = SecurityReport.query.filter(
         SecurityReport.created_at >= seven_days_ago
     ).count()
@@ -608,9 +1026,11 @@ def admin_stats():
 
 @app.route("/api/admin/posts/detailed")
 @admin_required
+@read_only
 def get_detailed_posts():
     # Get all posts with full details for admin view
     posts = Post.query.order_by(Post.created_at.desc()).all()
+    user_reactions = get_user_reactions([p.id for p in posts])
 
     detailed_posts = []
     for post in posts:
@@ -618,7 +1038,7 @@ def get_detailed_posts():
         dislikes = sum(1 for r in post.reactions if r.reaction_type == "dislike")
 
         # Get user reaction if admin is logged in (though admin can't react)
-        admin_reaction = None
+        admin_reaction = user_reactions.get(post.id)
 
         # Get admin response details
         admin_response = None
@@ -631,7 +1051,7 @@ def get_detailed_posts():
             {
                 "id": post.id,
                 "content": post.content,
-                "images": post.images,
+                "images": uploads.image_urls(post.images),
                 "category_id": post.category_id,
                 "category_name": post.category.name,
                 "user_id": post.user_id,
@@ -654,42 +1074,46 @@ def get_detailed_posts():
 
 @app.route("/api/admin/users", methods=["GET"])
 @admin_required
+@read_only
 def get_all_users():
-    users = User.query.all()
-    user_data = []
-
-    for user in users:
-        # Count user's posts, comments, reactions
-        post_count = len(user.posts)
-        comment_count = len(user.comments)
-        reaction_count = len(user.reactions)
-
-        # Get last activity (most recent post or comment)
-        last_activity = None
-        if user.posts:
-            last_post = max(user.posts, key=lambda p: p.created_at)
-            last_activity = last_post.created_at
-        if user.comments and (
-            not last_activity
-            or max(user.comments, key=lambda c: c.created_at).created_at > last_activity
-        ):
-            last_activity = max(user.comments, key=lambda c: c.created_at).created_at
-
-        user_data.append(
-            {
-                "id": user.id,
-                "email": user.email,
-                "role": user.role,
-                "posts_count": post_count,
-                "comments_count": comment_count,
-                "reactions_count": reaction_count,
-                "total_activity": post_count + comment_count + reaction_count,
-                "last_activity": last_activity.isoformat() if last_activity else None,
-                "joined_at": "2026-01-01T00:00:00Z",  # Placeholder since User model doesn't have created_at
-            }
-        )
-
-    return jsonify(user_data)
+    sort = request.args.get("sort", "activity")
+    if sort not in queries.USER_SORTS:
+        return {"error": f"sort must be one of {', '.join(queries.USER_SORTS)}"}, 400
+    descending = request.args.get("order", "desc") != "asc"
+    limit = min(max(request.args.get("limit", 50, type=int), 1), 200)
+    after = None
+    if request.args.get("after"):
+        try:
+            after = queries.decode_cursor(request.args["after"])
+        except ValueError:
+            return {"error": "Invalid cursor"}, 400
+
+    rows, next_cursor = queries.user_directory(
+        sort=sort,
+        descending=descending,
+        email_prefix=request.args.get("q", "").strip() or None,
+        after=after,
+        limit=limit,
+    )
+    return jsonify(
+        {
+            "users": [
+                {
+                    "id": row.id,
+                    "email": row.email,
+                    "role": row.role,
+                    "posts_count": row.posts_count,
+                    "comments_count": row.comments_count,
+                    "reactions_count": row.reactions_count,
+                    "total_activity": row.total_activity,
+                    "last_activity": row.last_activity,
+                    "joined_at": row.created_at,
+                }
+                for row in rows
+            ],
+            "next_cursor": next_cursor,
+        }
+    )
 
 
 @app.route("/api/admin/users/<int:user_id>", methods=["DELETE"])
@@ -700,36 +1124,144 @@ def delete_user(user_id):
         return {"error": "Cannot delete your own account"}, 400
 
     user = User.query.get_or_404(user_id)
+    email = user.email
 
-    # Delete associated data (cascade will handle most relationships)
-    # But we need to handle reactions manually since they can be null user_id
-    Reaction.query.filter_by(user_id=user_id).delete()
+    # Large accounts are deleted in the background so the worker isn't held
+    if deletion.user_size(user_id) > deletion.DELETION_ASYNC_THRESHOLD:
+        job = deletion.start_user_deletion(app, user)
+        return {
+            "message": f"Deletion of {email} started",
+            "job_id": job.id,
+            "status": job.status,
+        }, 202
+
+    deletion.purge_user(user_id)
+    return {"message": f"User {email} deleted successfully"}
+
+
+@app.route("/api/admin/deletion-jobs/<int:job_id>", methods=["GET"])
+@admin_required
+def get_deletion_job(job_id):
+    job = DeletionJob.query.get_or_404(job_id)
+    return {
+        "id": job.id,
+        "user_id": job.user_id,
+        "user_email": job.user_email,
+        "status": job.status,
+        "error": job.error,
+        "created_at": job.created_at,
+        "finished_at": job.finished_at,
+    }
+
+
+@app.route("/api/admin/hotspots", methods=["GET"])
+@admin_required
+@read_only
+def get_hotspots():
+    query = Hotspot.query.filter(Hotspot.campus_id == tenancy.request_campus_id())
+    if request.args.get("type"):
+        query = query.filter(Hotspot.type == request.args["type"])
+    limit = min(max(request.args.get("limit", 20, type=int), 1), 100)
+    rows = query.order_by(Hotspot.rank, Hotspot.report_count.desc()).limit(limit)
+    mark = db.session.get(JobWatermark, "hotspots")
+    return {
+        "hotspots": [
+            {
+                "id": h.id,
+                "type": h.type,
+                "rank": h.rank,
+                "report_count": h.report_count,
+                "latitude": h.latitude,
+                "longitude": h.longitude,
+                "radius_m": h.radius_m,
+                "cell_count": h.cell_count,
+                "hours": h.hours,
+                "recent_count": h.recent_count,
+                "previous_count": h.previous_count,
+                "trend": h.trend,
+            }
+            for h in rows
+        ],
+        "computed_at": mark.updated_at if mark else None,
+        "last_report_id": mark.last_id if mark else None,
+    }
+
+
+@app.route("/api/admin/hotspots/run", methods=["POST"])
+@admin_required
+def run_hotspot_job():
+    data = request.get_json(silent=True) or {}
+    try:
+        result = hotspots.run_hotspots(rebuild=bool(data.get("rebuild")))
+    except RuntimeError as e:
+        return {"error": str(e)}, 503
+    return result
 
-    db.session.delete(user)
-    db.session.commit()
 
-    return {"message": f"User {user.email} deleted successfully"}
+@app.route("/api/admin/analytics/incidents", methods=["GET"])
+@admin_required
+@read_only
+def get_incident_trends():
+    # start/end are campus-local dates (end inclusive); default: last 12 weeks
+    offset = timedelta(hours=trends.CAMPUS_UTC_OFFSET)
+    try:
+        start = request.args.get("start")
+        end = request.args.get("end")
+        start = datetime.fromisoformat(start) - offset if start else None
+        end = datetime.fromisoformat(end) + timedelta(days=1) - offset if end else None
+    except ValueError:
+        return {"error": "start and end must be YYYY-MM-DD"}, 400
+    if start and end and start >= end:
+        return {"error": "start must be before end"}, 400
+    max_days = trends.MAX_RANGE_DAYS
+    if start and (end or datetime.utcnow()) - start > timedelta(days=max_days):
+        return {"error": f"The range can span at most {max_days} days"}, 400
+    campus_id = tenancy.request_campus_id()
+    result = trends.incident_trends(campus_id, request.args.get("type"), start, end)
+    result["types"] = trends.report_types(campus_id)
+    return result
+
+
+@app.route("/api/admin/db-pool", methods=["GET"])
+@admin_required
+def get_db_pool_stats():
+    settings = db_pool.pool_settings()
+    return {
+        "settings": settings,
+        "max_connections_per_worker": None
+        if settings.get("pooler")
+        else settings["pool_size"] + settings["max_overflow"],
+        "binds": db_pool.pool_stats(db.engines),
+    }
 
 
 @app.route("/api/admin/streetwise-reports", methods=["GET"])
 @admin_required
+@read_only
 def get_streetwise_reports():
-    # Get all security reports (both active and archived)
-    security_reports = SecurityReport.query.order_by(
-        SecurityReport.created_at.desc()
-    ).all()
-
-    # Get all escort requests
-    escort_requests = EscortRequest.query.order_by(
-        EscortRequest.created_at.desc()
-    ).all()
+    now = datetime.utcnow()
+    days = min(max(request.args.get("days", 30, type=int), 1), 3650)
+    since = now - timedelta(days=days)
+    zone_id = request.args.get("zone_id", type=int)
+
+    pages = {}
+    for name, model in (("reports", SecurityReport), ("requests", EscortRequest)):
+        limit = min(max(request.args.get(f"{name}_limit", 50, type=int), 1), 200)
+        after = None
+        if request.args.get(f"{name}_after"):
+            try:
+                after = queries.decode_cursor(request.args[f"{name}_after"])
+            except ValueError:
+                return {"error": "Invalid cursor"}, 400
+        pages[name] = queries.streetwise_page(model, since, after, limit, zone_id)
 
     reports_data = []
     escort_data = []
 
-    for report in security_reports:
+    reports, reports_cursor = pages["reports"]
+    for report, user_email in reports:
         # Calculate age in hours
-        age_hours = (datetime.utcnow() - report.created_at).total_seconds() / 3600
+        age_hours = (now - report.created_at).total_seconds() / 3600
 
         reports_data.append(
             {
@@ -738,29 +1270,32 @@ def get_streetwise_reports():
                 "description": report.description,
                 "latitude": report.latitude,
                 "longitude": report.longitude,
-                "user_email": report.user.email if report.user else "Anonymous",
-                "created_at": report.created_at.isoformat(),
+                "zone_id": report.zone_id,
+                "user_email": user_email or "Anonymous",
+                "created_at": report.created_at,
                 "age_hours": round(age_hours, 1),
                 "is_active": age_hours <= 6,  # Active if less than 6 hours old
                 "status": "active" if age_hours <= 6 else "archived",
             }
         )
 
-    for request in escort_requests:
+    requests, requests_cursor = pages["requests"]
+    for escort, user_email in requests:
         # Calculate age in minutes
-        age_minutes = (datetime.utcnow() - request.created_at).total_seconds() / 60
+        age_minutes = (now - escort.created_at).total_seconds() / 60
 
         escort_data.append(
             {
-                "id": request.id,
-                "message": request.message,
-                "latitude": request.latitude,
-                "longitude": request.longitude,
-                "user_email": request.user.email,
-                "status": request.status,
-                "created_at": request.created_at.isoformat(),
+                "id": escort.id,
+                "message": escort.message,
+                "latitude": escort.latitude,
+                "longitude": escort.longitude,
+                "zone_id": escort.zone_id,
+                "user_email": user_email,
+                "status": escort.status,
+                "created_at": escort.created_at,
                 "age_minutes": round(age_minutes, 1),
-                "is_active": request.status == "active" and age_minutes <= 30,
+                "is_active": escort.status == "active" and age_minutes <= 30,
             }
         )
 
@@ -768,12 +1303,11 @@ def get_streetwise_reports():
         {
             "security_reports": reports_data,
             "escort_requests": escort_data,
-            "summary": {
-                "total_reports": len(reports_data),
-                "active_reports": len([r for r in reports_data if r["is_active"]]),
-                "total_requests": len(escort_data),
-                "active_requests": len([r for r in escort_data if r["is_active"]]),
-            },
+            "reports_next_cursor": reports_cursor,
+            "requests_next_cursor": requests_cursor,
+            "window_days": days,
+            "zone_id": zone_id,
+            "summary": queries.streetwise_summary(since, now, zone_id),
         }
     )
 
@@ -782,28 +1316,65 @@ def get_streetwise_reports():
 @student_required
 def create_security_report():
     data = request.get_json()
+    try:
+        latitude, longitude = zones.parse_point(data)
+    except ValueError as e:
+        return {"error": str(e)}, 400
     report = SecurityReport(
         type=data["type"],
         description=data["description"],
-        latitude=data["latitude"],
-        longitude=data["longitude"],
+        latitude=latitude,
+        longitude=longitude,
         user_id=session.get("user_id"),
+        created_at=datetime.utcnow(),
+        zone_id=zones.zone_for(tenancy.request_campus_id(), latitude, longitude),
     )
     db.session.add(report)
+    trends.record_report(tenancy.request_campus_id(), report.type, report.created_at)
     db.session.commit()
     return {"message": "Security report created"}, 201
 
 
+@app.route("/api/ingest/security-reports", methods=["POST"])
+@limiter.limit("120 per minute")
+def ingest_security_reports():
+    client = ingest.authenticate(request.headers.get("Authorization"))
+    if client is None:
+        return {"error": "Invalid API token"}, 401
+    tenancy.bind_campus(client.campus_id)
+    results = ingest.ingest(client, ingest.read_lines(request.stream))
+    if not results:
+        return {"error": "Expected NDJSON, one report per line"}, 400
+    statuses = [r["status"] for r in results]
+    app.logger.info(
+        "Ingested security reports",
+        extra={"client": client.name, "rows": len(results)},
+    )
+    return jsonify(
+        {
+            "received": len(results),
+            "created": statuses.count("created"),
+            "duplicates": statuses.count("duplicate"),
+            "errors": statuses.count("error"),
+            "results": results,
+        }
+    )
+
+
 @app.route("/api/security-reports", methods=["GET"])
 @student_required
+@coalesced()
+@read_only
 def get_security_reports():
     # Only return reports from last 6 hours with decay weights
     from datetime import datetime, timedelta
 
     six_hours_ago = datetime.utcnow() - timedelta(hours=6)
+    zone_id = request.args.get("zone_id", type=int)
 
     reports = SecurityReport.query.filter(
-        SecurityReport.created_at >= six_hours_ago
+        SecurityReport.created_at >= six_hours_ago,
+        *queries.zone_filter(SecurityReport, zone_id),
     ).all()
 
     # Calculate decay weight: 1.0 at 0 hours, 0.0 at 6 hours (removed from map)
@@ -822,10 +1393,11 @@ def get_security_reports():
                     "description": report.description,
                     "latitude": report.latitude,
                     "longitude": report.longitude,
+                    "zone_id": report.zone_id,
                     "decay_weight": decay_weight,
                     "intensity": 0.8 if report.type in ["theft", "harassment"] else 0.5,
                     "age_hours": age_hours,
-                    "created_at": report.created_at.isoformat(),
+                    "created_at": report.created_at,
                 }
             )
 
@@ -833,14 +1405,17 @@ def get_security_reports():
 
 
 @app.route("/api/security-reports/archive", methods=["GET"])
+@read_only
 def get_archived_security_reports():
     # Return reports older than 6 hours (archived/historical)
     from datetime import datetime, timedelta
 
     six_hours_ago = datetime.utcnow() - timedelta(hours=6)
+    zone_id = request.args.get("zone_id", type=int)
 
     reports = SecurityReport.query.filter(
-        SecurityReport.created_at <= six_hours_ago
+        SecurityReport.created_at <= six_hours_ago,
+        *queries.zone_filter(SecurityReport, zone_id),
     ).all()
 
     result = []
@@ -852,8 +1427,9 @@ def get_archived_security_reports():
                 "type": report.type,
                 "latitude": report.latitude,
                 "longitude": report.longitude,
+                "zone_id": report.zone_id,
                 "description": report.description,
-                "created_at": report.created_at.isoformat(),
+                "created_at": report.created_at,
                 "age_hours": age_hours,
                 "status": "archived",
             }
@@ -870,11 +1446,17 @@ def create_escort_request():
     if not user_id:
         return {"error": "Not logged in"}, 401
 
+    try:
+        latitude, longitude = zones.parse_point(data)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
     request_obj = EscortRequest(
         message=data["message"],
-        latitude=data["latitude"],
-        longitude=data["longitude"],
+        latitude=latitude,
+        longitude=longitude,
         user_id=user_id,
+        zone_id=zones.zone_for(tenancy.request_campus_id(), latitude, longitude),
     )
     db.session.add(request_obj)
     db.session.commit()
@@ -883,14 +1465,18 @@ def create_escort_request():
 
 @app.route("/api/escort-requests", methods=["GET"])
 @student_required
+@read_only
 def get_escort_requests():
     # Only return active requests from last 30 minutes
     from datetime import datetime, timedelta
 
     thirty_min_ago = datetime.utcnow() - timedelta(minutes=30)
+    zone_id = request.args.get("zone_id", type=int)
 
     requests = EscortRequest.query.filter(
-        EscortRequest.created_at >= thirty_min_ago, EscortRequest.status == "active"
+        EscortRequest.created_at >= thirty_min_ago,
+        EscortRequest.status == "active",
+        *queries.zone_filter(EscortRequest, zone_id),
     ).all()
 
     return jsonify(
@@ -900,6 +1486,7 @@ def get_escort_requests():
                 "message": r.message,
                 "latitude": r.latitude,
                 "longitude": r.longitude,
+                "zone_id": r.zone_id,
                 "created_at": r.created_at,
             }
             for r in requests
@@ -930,7 +1517,7 @@ def get_chat_messages(report_id):
                 "id": msg.id,
                 "message": msg.message,
                 "user_id": msg.user_id,
-                "created_at": msg.created_at.isoformat(),
+                "created_at": msg.created_at,
             }
             for msg in messages
         ]
@@ -1000,6 +1587,7 @@ def update_category(id):
 
     category.name = data["name"]
     category.description = data.get("description", category.description)
+    recent_feed.category_renamed(category.campus_id, id, category.name)
     db.session.commit()
 
     return {
@@ -1023,14 +1611,98 @@ def delete_category(id):
     return {"message": "Category deleted successfully"}
 
 
+def zone_json(zone):
+    return {"id": zone.id, "name": zone.name, "polygon": zone.polygon}
+
+
+def parse_zone(data):
+    """(name, polygon) from a zone request body; raises ValueError."""
+    name = (data.get("name") or "").strip()
+    if not name:
+        raise ValueError("Zone name is required")
+    settings = tenancy.current_settings()
+    center = None
+    if settings.latitude is not None and settings.longitude is not None:
+        center = (settings.latitude, settings.longitude)
+    return name, zones.parse_polygon(data.get("polygon"), center)
+
+
+@app.route("/api/zones", methods=["GET"])
+@read_only
+def get_zones():
+    return jsonify([zone_json(z) for z in Zone.query.order_by(Zone.name)])
+
+
+@app.route("/api/admin/zones", methods=["GET"])
+@admin_required
+@read_only
+def get_admin_zones():
+    all_zones = Zone.query.order_by(Zone.name).all()
+    counts = queries.zone_counts([z.id for z in all_zones], datetime.utcnow())
+    return jsonify(
+        {
+            "zones": [{**zone_json(z), **counts[z.id]} for z in all_zones],
+            "unzoned": counts[None],
+        }
+    )
+
+
+@app.route("/api/admin/zones", methods=["POST"])
+@admin_required
+def create_zone():
+    try:
+        name, polygon = parse_zone(request.get_json() or {})
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    if Zone.query.filter_by(name=name).first():
+        return {"error": "Zone with this name already exists"}, 400
+
+    zone = Zone(name=name, polygon=polygon)
+    db.session.add(zone)
+    db.session.commit()
+    restamped = zones.restamp(zone.campus_id, [zone.id], [zones.bounding_box(polygon)])
+    db.session.commit()
+    return {**zone_json(zone), "restamped": restamped}, 201
+
+
+@app.route("/api/admin/zones/<int:id>", methods=["PUT"])
+@admin_required
+def update_zone(id):
+    zone = Zone.query.get_or_404(id)
+    try:
+        name, polygon = parse_zone(request.get_json() or {})
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    existing = Zone.query.filter_by(name=name).first()
+    if existing and existing.id != id:
+        return {"error": "Zone with this name already exists"}, 400
+
+    boxes = [zones.bounding_box(zone.polygon), zones.bounding_box(polygon)]
+    zone.name = name
+    zone.polygon = polygon
+    db.session.commit()
+    restamped = zones.restamp(zone.campus_id, [zone.id], boxes)
+    db.session.commit()
+    return {**zone_json(zone), "restamped": restamped}
+
+
+@app.route("/api/admin/zones/<int:id>", methods=["DELETE"])
+@admin_required
+def delete_zone(id):
+    zone = Zone.query.get_or_404(id)
+    campus_id, box = zone.campus_id, zones.bounding_box(zone.polygon)
+    db.session.delete(zone)
+    db.session.commit()
+    # Rows inside it move to an overlapping zone, or to none
+    restamped = zones.restamp(campus_id, [id], [box])
+    db.session.commit()
+    return {"message": "Zone deleted successfully", "restamped": restamped}
+
+
 @app.route("/api/admin/university-settings", methods=["GET"])
 @admin_required
 def get_university_settings():
-    settings = UniversitySettings.query.first()
-    if not settings:
-        settings = UniversitySettings()
-        db.session.add(settings)
-        db.session.commit()
+    settings = tenancy.current_settings()
     return {
         "name": settings.name,
         "latitude": settings.latitude,
@@ -1043,11 +1715,7 @@ def get_university_settings():
 @admin_required
 def update_university_settings():
     data = request.get_json()
-    settings = UniversitySettings.query.first()
-    if not settings:
-        settings = UniversitySettings()
-        db.session.add(settings)
-
+    settings = tenancy.current_settings()
     settings.name = data.get("name", settings.name)
     settings.latitude = data.get("latitude", settings.latitude)
     settings.longitude = data.get("longitude", settings.longitude)
@@ -1058,12 +1726,9 @@ def update_university_settings():
 
 
 @app.route("/api/university-settings", methods=["GET"])
+@read_only
 def get_public_university_settings():
-    settings = UniversitySettings.query.first()
-    if not settings:
-        settings = UniversitySettings()
-        db.session.add(settings)
-        db.session.commit()
+    settings = tenancy.current_settings()
     return {
         "name": settings.name,
         "latitude": settings.latitude,
@@ -1101,7 +1766,8 @@ def update_user_profile():
             return {"error": "Email cannot be empty"}, 400
         if not is_valid_email(new_email):
             return {"error": "Invalid email format"}, 400
-        existing = User.query.filter_by(email=new_email).first()
+        with tenancy.unscoped():
+            existing = User.query.filter_by(email=new_email).first()
         if existing and existing.id != uid:
             return {"error": "Email already taken"}, 400
         user.email = new_email
@@ -1115,119 +1781,146 @@ def update_user_profile():
 
 
 @app.route("/api/user/activity", methods=["GET"])
+@read_only
 def get_user_activity():
     uid = session.get("user_id")
     if not uid:
         return {"error": "Not logged in"}, 401
 
-    # Get user's posts
-    posts = Post.query.filter_by(user_id=uid).order_by(Post.created_at.desc()).all()
-    posts_data = []
-    for p in posts:
-        likes = sum(1 for r in p.reactions if r.reaction_type == "like")
-        dislikes = sum(1 for r in p.reactions if r.reaction_type == "dislike")
-        posts_data.append(
-            {
-                "id": p.id,
-                "content": p.content,
-                "images": p.images,
-                "category_name": p.category.name,
-                "created_at": p.created_at,
-                "likes": likes,
-                "dislikes": dislikes,
-                "comments_count": len(p.comments),
-            }
-        )
-
-    # Get user's comments
-    comments = (
-        Comment.query.filter_by(user_id=uid).order_by(Comment.created_at.desc()).all()
-    )
-    comments_data = [
-        {
-            "id": c.id,
-            "content": c.content,
-            "images": c.images,
-            "post_id": c.post_id,
-            "post_content": c.post.content[:50] + "..."
-            if len(c.post.content) > 50
-            else c.post.content,
-            "created_at": c.created_at,
-        }
-        for c in comments
-    ]
-
-    # Get user's reactions
-    reactions = (
-        Reaction.query.filter_by(user_id=uid).order_by(Reaction.created_at.desc()).all()
+    sections = queries.ACTIVITY_SECTIONS
+    if request.args.get("types"):
+        sections = tuple(request.args["types"].split(","))
+        if not set(sections) <= set(queries.ACTIVITY_SECTIONS):
+            return {
+                "error": f"types must be among {', '.join(queries.ACTIVITY_SECTIONS)}"
+            }, 400
+    limit = min(max(request.args.get("limit", 20, type=int), 1), 100)
+    before = None
+    if request.args.get("before"):
+        try:
+            created_at, section, item_id = queries.decode_cursor(
+                request.args["before"]
+            )
+            before = (datetime.fromisoformat(created_at), section, int(item_id))
+        except (ValueError, TypeError):
+            return {"error": "Invalid cursor"}, 400
+
+    items, next_cursor = queries.user_activity(app, uid, sections, before, limit)
+
+    post_ids = [i["id"] for i in items if i["type"] == "posts"]
+    user_reactions = get_user_reactions(post_ids)
+    grouped = {section: [] for section in queries.ACTIVITY_SECTIONS}
+    for item in items:
+        if item["type"] == "posts":
+            item["user_reaction"] = user_reactions.get(item["id"])
+        grouped[item["type"]].append(item)
+
+    # The per-type lists are the same page, grouped as the profile tabs expect
+    return jsonify({"timeline": items, "next_cursor": next_cursor, **grouped})
+
+
+def backfill_user_joined_dates():
+    # Users created before User.created_at existed: use their first post or
+    # comment as the best available join date
+    first_post = (
+        db.select(func.min(Post.created_at))
+        .where(Post.user_id == User.id)
+        .scalar_subquery()
     )
-    reactions_data = [
-        {
-            "id": r.id,
-            "reaction_type": r.reaction_type,
-            "post_id": r.post_id,
-            "post_content": r.post.content[:50] + "..."
-            if len(r.post.content) > 50
-            else r.post.content,
-            "created_at": r.created_at,
-        }
-        for r in reactions
-    ]
-
-    # Get user's security reports
-    security_reports = (
-        SecurityReport.query.filter_by(user_id=uid)
-        .order_by(SecurityReport.created_at.desc())
-        .all()
+    first_comment = (
+        db.select(func.min(Comment.created_at))
+        .where(Comment.user_id == User.id)
+        .scalar_subquery()
     )
-    security_data = [
-        {
-            "id": r.id,
-            "type": r.type,
-            "description": r.description,
-            "latitude": r.latitude,
-            "longitude": r.longitude,
-            "created_at": r.created_at,
-        }
-        for r in security_reports
-    ]
-
-    # Get user's escort requests
-    escort_requests = (
-        EscortRequest.query.filter_by(user_id=uid)
-        .order_by(EscortRequest.created_at.desc())
-        .all()
+    User.query.filter(User.created_at.is_(None)).update(
+        {User.created_at: func.coalesce(first_post, first_comment, datetime.utcnow())},
+        synchronize_session=False,
     )
-    escort_data = [
-        {
-            "id": r.id,
-            "message": r.message,
-            "latitude": r.latitude,
-            "longitude": r.longitude,
-            "status": r.status,
-            "created_at": r.created_at,
-        }
-        for r in escort_requests
-    ]
+    db.session.commit()
 
-    return {
-        "posts": posts_data,
-        "comments": comments_data,
-        "reactions": reactions_data,
-        "security_reports": security_data,
-        "escort_requests": escort_data,
-    }
 
+# Derived tables that are rebuilt from source rows rather than migrated
+ROLLUP_TABLES = ["incident_hour", "hotspot_cell", "hotspot"]
 
 # Initialize database
 try:
     with app.app_context():
+        schema.drop_outdated_rollups(ROLLUP_TABLES)
         db.create_all()
+        added = schema.upgrade_schema()
+        tenancy.ensure_default_campus()
+        if "post.likes_count" in added:
+            ranking.recount_posts()
+        if "user.created_at" in added:
+            backfill_user_joined_dates()
+        if "post.moderation_status" in added:
+            queries.restamp_moderation_status()
+        search.init_search_index()
+        trends.backfill()
+        duplicates.build()
+        recent_feed.warm()
         app.logger.info("Database initialized successfully")
 except Exception as e:
-    app.logger.error(f"Database initialization failed: {str(e)}")
+    app.logger.error("Database initialization failed: %s", e)
     # Don't crash the app, just log the error
 
+ranking.start_hot_rescorer(app)
+reaction_buffer.start_reaction_flusher(app)
+try:
+    with app.app_context():
+        deletion.resume_deletion_jobs(app)
+except Exception as e:
+    app.logger.error("Resuming deletion jobs failed: %s", e)
+
+
+@app.cli.command("hotspots")
+@click.option("--rebuild", is_flag=True, help="Recount every report from scratch.")
+def hotspots_command(rebuild):
+    """Bin new security reports and recompute the ranked hotspots."""
+    result = hotspots.run_hotspots(rebuild=rebuild)
+    print(
+        f"Binned {result['reports_binned']} reports into {result['hotspots']} hotspots"
+    )
+
+
+@app.cli.command("create-campus")
+@click.argument("slug")
+@click.argument("name")
+def create_campus_command(slug, name):
+    """Add a campus, with the default campus's categories."""
+    campus = tenancy.create_campus(slug, name)
+    print(f"Created campus {campus.id} ({slug}); select it with 'X-Campus: {slug}'")
+
+
+@app.cli.command("create-api-client")
+@click.argument("name")
+@click.option("--campus", default="default", help="Slug of the client's campus.")
+def create_api_client_command(name, campus):
+    """Register a partner system for /api/ingest/security-reports."""
+    campus_id = tenancy.campus_id_for(campus)
+    if campus_id is None:
+        raise click.BadParameter(f"unknown campus {campus!r}", param_hint="--campus")
+    client, token = ingest.create_client(name, campus_id)
+    print(f"Created API client {client.id} ({name}). Token, shown only once:")
+    print(token)
+
+
+@app.cli.command("restamp-zones")
+def restamp_zones_command():
+    """Recompute the zone of every security report and escort request."""
+    changed = 0
+    for campus_id in db.session.scalars(db.select(UniversitySettings.id)):
+        changed += zones.restamp(campus_id)
+    db.session.commit()
+    print(f"Moved {changed} rows to a different zone")
+
+
+@app.cli.command("rescore-hot")
+def rescore_hot_command():
+    """Re-decay the hot feed scores now."""
+    print(f"Rescored {ranking.rescore_hot_posts()} posts")
+
+
 # Check if running in production (Render provides PORT env var)
 if os.environ.get("PORT"):
     # Production deployment (Render)
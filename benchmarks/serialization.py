@@ -0,0 +1,137 @@
+"""Per-endpoint JSON serialization time, orjson vs the stdlib encoder.
+
+Seeds a throwaway SQLite database, then requests the large list endpoints
+through the test client and reports total request time and the share spent
+in the JSON provider.
+
+    python benchmarks/serialization.py [--posts 3000] [--reports 5000] [--runs 5]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), "bench.db")
+os.environ["DATABASE_URI"] = f"sqlite:///{DB_PATH}"
+os.environ.setdefault("HOT_RESCORE_INTERVAL", "0")
+
+from app import app, db, limiter  # noqa: E402
+from json_provider import FastJSONProvider, _default  # noqa: E402
+from models import Category, Post, SecurityReport, User  # noqa: E402
+import ranking  # noqa: E402
+
+ENDPOINTS = [
+    "/api/admin/posts/detailed",
+    "/api/admin/users?limit=200",
+    "/api/security-reports/archive",
+]
+
+
+class StdlibJSONProvider(FastJSONProvider):
+    backend = "json"
+
+    def dumpb(self, obj):
+        return json.dumps(
+            obj, default=_default, ensure_ascii=False, separators=(",", ":")
+        ).encode()
+
+
+def timed(provider_cls):
+    """Provider subclass that accumulates time spent encoding responses."""
+
+    class Timed(provider_cls):
+        elapsed = 0.0
+
+        def dumpb(self, obj):
+            start = time.perf_counter()
+            try:
+                return super().dumpb(obj)
+            finally:
+                type(self).elapsed += time.perf_counter() - start
+
+    return Timed
+
+
+def seed(n_posts, n_reports):
+    random.seed(1)
+    now = datetime.utcnow()
+    with app.app_context():
+        categories = [Category(name=f"Category {i}") for i in range(5)]
+        db.session.add_all(categories)
+        admin = User(email="admin@bench.test", role="admin")
+        admin.set_password("bench")
+        users = [User(email=f"student{i}@bench.test") for i in range(200)]
+        for u in users:
+            u.password_hash = "x"
+        db.session.add_all([admin, *users])
+        db.session.flush()
+        db.session.add_all(
+            Post(
+                content=f"Post {i} " + "lorem ipsum " * random.randint(2, 20),
+                images=[],
+                user_id=random.choice(users).id,
+                category_id=random.choice(categories).id,
+                created_at=now - timedelta(minutes=i),
+            )
+            for i in range(n_posts)
+        )
+        db.session.add_all(
+            SecurityReport(
+                type=random.choice(["theft", "harassment", "lighting", "other"]),
+                description="Report " + "details " * random.randint(2, 30),
+                latitude=-1.29 + random.random() / 100,
+                longitude=36.82 + random.random() / 100,
+                created_at=now - timedelta(hours=7 + i),
+            )
+            for i in range(n_reports)
+        )
+        db.session.commit()
+        ranking.recount_posts()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--posts", type=int, default=3000)
+    parser.add_argument("--reports", type=int, default=5000)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    seed(args.posts, args.reports)
+    limiter.enabled = False
+    client = app.test_client()
+    client.post("/auth/login", json={"email": "admin@bench.test", "password": "bench"})
+
+    providers = [StdlibJSONProvider]
+    if FastJSONProvider.backend == "orjson":
+        providers.append(FastJSONProvider)
+    else:
+        print("orjson is not installed; only the stdlib encoder is measured\n")
+
+    print(f"{'endpoint':34} {'encoder':8} {'bytes':>9} {'total ms':>9} {'json ms':>8}")
+    for path in ENDPOINTS:
+        for provider_cls in providers:
+            app.json = timed(provider_cls)(app)
+            client.get(path)  # warm up
+            type(app.json).elapsed = 0.0
+            start = time.perf_counter()
+            for _ in range(args.runs):
+                response = client.get(path)
+            total = (time.perf_counter() - start) / args.runs * 1000
+            encode = type(app.json).elapsed / args.runs * 1000
+            print(
+                f"{path:34} {provider_cls.backend:8} {len(response.data):>9} "
+                f"{total:>9.1f} {encode:>8.1f}"
+            )
+    app.json = FastJSONProvider(app)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""Single-flight coalescing for expensive read endpoints.
+
+Views decorated with ``@coalesced`` share one computation between identical
+concurrent requests: the first request for a key runs the view and every
+request for the same key that arrives meanwhile waits for, and returns, its
+response. The key is the endpoint, its arguments, the query string and the
+request's campus (plus the user with ``per_user=True``); put the decorator
+below the auth decorators so access is still checked per request.
+
+A 200 response is then reused for COALESCE_TTL_MS. For a further
+COALESCE_STALE_MS (stale-while-revalidate) the next request recomputes it
+while concurrent ones get the stale copy instead of waiting. Responses
+carry an ``Age`` header with the result's age in seconds. Clients pinned to
+the primary after a write (see replicas.py) always get a fresh computation.
+
+With COALESCE_SHARED_DIR set, workers on the same host also share results:
+the computation runs under an exclusive ``flock`` on a per-key file in that
+directory and the result is written next to it, so a worker that was
+waiting on the lock reads the result rather than recomputing. POSIX only.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, request, session
+
+import tenancy
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+COALESCE_ENABLED = os.getenv("COALESCE_ENABLED", "1") == "1"
+COALESCE_TTL_MS = int(os.getenv("COALESCE_TTL_MS", "1000"))
+COALESCE_STALE_MS = int(os.getenv("COALESCE_STALE_MS", "0"))
+COALESCE_MAX_ENTRIES = int(os.getenv("COALESCE_MAX_ENTRIES", "1000"))
+COALESCE_SHARED_DIR = os.getenv("COALESCE_SHARED_DIR")
+
+# Recomputed per response, never reused
+SKIP_HEADERS = {"content-length", "set-cookie", "age"}
+
+
+class Result:
+    __slots__ = ("status", "headers", "body", "created")
+
+    def __init__(self, status, headers, body, created):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.created = created
+
+    @classmethod
+    def capture(cls, response):
+        headers = [(k, v) for k, v in response.headers if k.lower() not in SKIP_HEADERS]
+        return cls(response.status_code, headers, response.get_data(), time.time())
+
+    def to_response(self):
+        response = current_app.response_class(
+            self.body, status=self.status, headers=self.headers
+        )
+        response.headers["Age"] = str(int(time.time() - self.created))
+        return response
+
+
+class Flight:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._flights = {}
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+        self.computed = 0
+        self.coalesced = 0
+        self.fresh_hits = 0
+        self.stale_hits = 0
+
+    def get(self, key, compute, ttl, stale):
+        with self._lock:
+            result = self._results.get(key)
+            age = time.time() - result.created if result else None
+            if result is not None and age < ttl:
+                self.fresh_hits += 1
+                self._results.move_to_end(key)
+                return result
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = Flight()
+            elif result is not None and age < ttl + stale:
+                self.stale_hits += 1
+                return result
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = compute()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self.computed += 1
+                del self._flights[key]
+                if flight.result is not None and flight.result.status == 200:
+                    self._results[key] = flight.result
+                    self._results.move_to_end(key)
+                    while len(self._results) > self.max_entries:
+                        self._results.popitem(last=False)
+            flight.done.set()
+        return flight.result
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": len(self._flights),
+                "results": len(self._results),
+                "computed": self.computed,
+                "coalesced": self.coalesced,
+                "fresh_hits": self.fresh_hits,
+                "stale_hits": self.stale_hits,
+            }
+
+
+flights = SingleFlight(COALESCE_MAX_ENTRIES)
+
+
+def _read_shared(path):
+    try:
+        with open(path, "rb") as f:
+            meta, _, body = f.read().partition(b"\n")
+    except FileNotFoundError:
+        return None
+    meta = json.loads(meta)
+    return Result(meta["status"], meta["headers"], body, meta["created"])
+
+
+def _write_shared(path, result):
+    meta = {
+        "status": result.status,
+        "headers": result.headers,
+        "created": result.created,
+    }
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(json.dumps(meta).encode() + b"\n" + result.body)
+    os.replace(tmp, path)
+
+
+def _compute_shared(key, compute, ttl, stale):
+    """Compute under a host-wide lock, or take another worker's fresh result."""
+    digest = hashlib.blake2b(repr(key).encode(), digest_size=16).hexdigest()
+    path = os.path.join(COALESCE_SHARED_DIR, digest)
+    with open(path + ".lock", "a") as lock:
+        result = _read_shared(path)
+        age = time.time() - result.created if result else None
+        if result is not None and age < ttl:
+            return result
+        if result is not None and age < ttl + stale:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Another worker is revalidating it
+                return result
+        else:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            result = _read_shared(path)
+            if result is not None and time.time() - result.created < ttl:
+                return result
+            result = compute()
+            if result.status == 200:
+                _write_shared(path, result)
+            return result
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def coalesced(per_user=False):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # Writers read their own writes, as with replica routing
+            if (
+                not COALESCE_ENABLED
+                or request.method != "GET"
+                or session.get("primary_until", 0) >= time.time()
+            ):
+                return view(*args, **kwargs)
+            key = (
+                request.endpoint,
+                tuple(sorted(kwargs.items())),
+                tuple(sorted(request.args.items(multi=True))),
+                tenancy.current_campus_id(),
+                session.get("user_id") if per_user else None,
+            )
+            ttl, stale = COALESCE_TTL_MS / 1000, COALESCE_STALE_MS / 1000
+
+            def compute():
+                response = current_app.make_response(view(*args, **kwargs))
+                return Result.capture(response)
+
+            if COALESCE_SHARED_DIR and fcntl is not None:
+                run = compute
+
+                def compute():
+                    return _compute_shared(key, run, ttl, stale)
+
+            return flights.get(key, compute, ttl, stale).to_response()
+
+        return wrapper
+
+    return decorator
+
+
+def init_coalescing():
+    if COALESCE_SHARED_DIR:
+        os.makedirs(COALESCE_SHARED_DIR, exist_ok=True)
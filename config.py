@@ -1,3 +1,10 @@
+import os
+
 from flask_sqlalchemy import SQLAlchemy
 
-db = SQLAlchemy()
\ No newline at end of file
+from replicas import RoutingSession
+
+db = SQLAlchemy(session_options={"class_": RoutingSession})
+
+# Campus local time, for hour-of-day and hour-of-week analytics
+CAMPUS_UTC_OFFSET = int(os.getenv("CAMPUS_UTC_OFFSET", "3"))
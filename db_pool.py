@@ -0,0 +1,188 @@
+"""Connection pool configuration and telemetry.
+
+Pool settings come from a deployment profile (DB_POOL_PROFILE) and can be
+overridden one by one with DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT,
+DB_POOL_RECYCLE and DB_PRE_PING (always | never). The
+``transaction_pooler`` profile is for PgBouncer / Supavisor in transaction
+mode: the external pooler owns the connections, so each checkout opens a
+fresh one (NullPool) and nothing is held between requests.
+
+Each worker holds at most ``pool_size + max_overflow`` connections per
+bind, so size the pool so that
+``workers * (pool_size + max_overflow) * (1 + replicas)`` stays under the
+server's ``max_connections`` minus its reserved slots.
+"""
+
+import os
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import NullPool, QueuePool
+
+POOL_PROFILES = {
+    # Current behaviour: SQLAlchemy's default sizes, pre-ping on
+    "default": {
+        "pool_size": 5,
+        "max_overflow": 10,
+        "pool_timeout": 30,
+        "pool_recycle": 300,
+        "pre_ping": "always",
+    },
+    # Shared/free Postgres tiers with a low max_connections
+    "small": {
+        "pool_size": 2,
+        "max_overflow": 3,
+        "pool_timeout": 10,
+        "pool_recycle": 300,
+        "pre_ping": "always",
+    },
+    # Dedicated database, many threads per worker. Connections that die are
+    # invalidated on first use instead of paying a ping on every checkout.
+    "large": {
+        "pool_size": 20,
+        "max_overflow": 10,
+        "pool_timeout": 10,
+        "pool_recycle": 1800,
+        "pre_ping": "never",
+    },
+    "transaction_pooler": {"pooler": True, "pre_ping": "never"},
+}
+
+
+class PoolTelemetry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record_wait(self, seconds):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+
+    def incr(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "connects": self.connects,
+                "invalidations": self.invalidations,
+                "timeouts": self.timeouts,
+                "wait_ms_total": round(self.wait_total * 1000, 3),
+                "wait_ms_avg": (
+                    round(self.wait_total * 1000 / self.checkouts, 3)
+                    if self.checkouts
+                    else 0.0
+                ),
+                "wait_ms_max": round(self.wait_max * 1000, 3),
+            }
+
+
+class TimedPoolMixin:
+    """Times how long each checkout waits for (or opens) a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.telemetry = PoolTelemetry()
+
+    def recreate(self):
+        # engine.dispose() replaces the pool; keep counting across it
+        pool = super().recreate()
+        pool.telemetry = self.telemetry
+        return pool
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            self.telemetry.incr("timeouts")
+            raise
+        finally:
+            self.telemetry.record_wait(time.perf_counter() - start)
+
+
+class TimedQueuePool(TimedPoolMixin, QueuePool):
+    pass
+
+
+class TimedNullPool(TimedPoolMixin, NullPool):
+    pass
+
+
+def pool_settings():
+    profile = os.getenv("DB_POOL_PROFILE", "default")
+    if profile not in POOL_PROFILES:
+        choices = ", ".join(POOL_PROFILES)
+        raise ValueError(f"DB_POOL_PROFILE must be one of {choices}, not {profile!r}")
+    settings = dict(POOL_PROFILES[profile], profile=profile)
+    for key, env, cast in (
+        ("pool_size", "DB_POOL_SIZE", int),
+        ("max_overflow", "DB_MAX_OVERFLOW", int),
+        ("pool_timeout", "DB_POOL_TIMEOUT", float),
+        ("pool_recycle", "DB_POOL_RECYCLE", int),
+        ("pre_ping", "DB_PRE_PING", str),
+    ):
+        if os.getenv(env):
+            settings[key] = cast(os.getenv(env))
+    return settings
+
+
+def engine_options(settings=None):
+    """``SQLALCHEMY_ENGINE_OPTIONS`` for the selected profile."""
+    settings = settings or pool_settings()
+    options = {"pool_pre_ping": settings["pre_ping"] == "always"}
+    if settings.get("pooler"):
+        options["poolclass"] = TimedNullPool
+    else:
+        options.update(
+            poolclass=TimedQueuePool,
+            pool_size=settings["pool_size"],
+            max_overflow=settings["max_overflow"],
+            pool_timeout=settings["pool_timeout"],
+            pool_recycle=settings["pool_recycle"],
+        )
+    return options
+
+
+def init_pool_telemetry(engines):
+    for engine in engines.values():
+        pool = engine.pool
+        if not hasattr(pool, "telemetry"):
+            continue
+        telemetry = pool.telemetry
+        event.listen(pool, "connect", lambda *a, t=telemetry: t.incr("connects"))
+        event.listen(
+            pool, "invalidate", lambda *a, t=telemetry: t.incr("invalidations")
+        )
+        event.listen(
+            pool, "soft_invalidate", lambda *a, t=telemetry: t.incr("invalidations")
+        )
+
+
+def pool_stats(engines):
+    stats = {}
+    for key, engine in engines.items():
+        pool = engine.pool
+        entry = {"pool": type(pool).__name__}
+        if isinstance(pool, QueuePool):
+            entry.update(
+                size=pool.size(),
+                checked_out=pool.checkedout(),
+                checked_in=pool.checkedin(),
+                overflow=max(pool.overflow(), 0),
+            )
+        if hasattr(pool, "telemetry"):
+            entry.update(pool.telemetry.snapshot())
+        stats[key or "primary"] = entry
+    return stats
@@ -0,0 +1,186 @@
+"""Set-based deletes for posts and user accounts.
+
+Children are removed with bulk ``DELETE ... WHERE ... IN`` statements,
+children first, so this works whether or not the database enforces the
+``ON DELETE CASCADE`` declared on the models (SQLite doesn't by default,
+and databases created before those FKs existed don't have them). Accounts
+above DELETION_ASYNC_THRESHOLD rows are deleted by a background job that
+commits batch by batch and is tracked in ``DeletionJob``.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from sqlalchemy import delete, func, select, update
+
+from config import db
+from models import (
+    User,
+    Post,
+    Comment,
+    Reaction,
+    AdminResponse,
+    SecurityReport,
+    EscortRequest,
+    ChatMessage,
+    DeletionJob,
+)
+import duplicates
+import ranking
+import recent_feed
+import search
+import trends
+
+DELETION_ASYNC_THRESHOLD = int(os.getenv("DELETION_ASYNC_THRESHOLD", "500"))
+DELETION_BATCH_SIZE = 500
+
+deletion_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="deletion")
+
+
+def _bulk_delete(model, *criteria):
+    db.session.execute(
+        delete(model).where(*criteria).execution_options(synchronize_session=False)
+    )
+
+
+def _batches(ids):
+    for start in range(0, len(ids), DELETION_BATCH_SIZE):
+        yield ids[start : start + DELETION_BATCH_SIZE]
+
+
+def delete_posts(post_ids):
+    """Delete posts with their reactions, comments and responses. Does not commit."""
+    if not post_ids:
+        return
+    comment_ids = db.session.scalars(
+        select(Comment.id).where(Comment.post_id.in_(post_ids))
+    ).all()
+    search.unindex(post_ids=post_ids, comment_ids=comment_ids)
+    duplicates.forget(post_ids)
+    recent_feed.posts_deleted(post_ids)
+    db.session.execute(
+        update(Post)
+        .where(Post.duplicate_of_id.in_(post_ids))
+        .values(duplicate_of_id=None)
+        .execution_options(synchronize_session=False)
+    )
+    _bulk_delete(Reaction, Reaction.post_id.in_(post_ids))
+    _bulk_delete(Comment, Comment.post_id.in_(post_ids))
+    _bulk_delete(AdminResponse, AdminResponse.post_id.in_(post_ids))
+    _bulk_delete(Post, Post.id.in_(post_ids))
+
+
+def user_size(user_id):
+    """Number of posts, comments and reactions owned by a user."""
+    return db.session.scalar(
+        select(
+            select(func.count(Post.id)).where(Post.user_id == user_id).scalar_subquery()
+            + select(func.count(Comment.id))
+            .where(Comment.user_id == user_id)
+            .scalar_subquery()
+            + select(func.count(Reaction.id))
+            .where(Reaction.user_id == user_id)
+            .scalar_subquery()
+        )
+    )
+
+
+def purge_user(user_id, commit_batches=False):
+    """Delete a user and everything they own, then commit.
+
+    With commit_batches the user's posts are deleted (and committed) in
+    batches so no single transaction holds locks for long.
+    """
+    campus_id = db.session.scalar(select(User.campus_id).where(User.id == user_id))
+    post_ids = db.session.scalars(select(Post.id).where(Post.user_id == user_id)).all()
+    for batch in _batches(post_ids):
+        delete_posts(batch)
+        if commit_batches:
+            db.session.commit()
+
+    # Comments and reactions left on other people's posts change their counters
+    touched = set(
+        db.session.scalars(
+            select(Comment.post_id).where(Comment.user_id == user_id).distinct()
+        )
+    ) | set(
+        db.session.scalars(
+            select(Reaction.post_id).where(Reaction.user_id == user_id).distinct()
+        )
+    )
+    comment_ids = db.session.scalars(
+        select(Comment.id).where(Comment.user_id == user_id)
+    ).all()
+    search.unindex(comment_ids=comment_ids)
+    _bulk_delete(Comment, Comment.user_id == user_id)
+    _bulk_delete(Reaction, Reaction.user_id == user_id)
+    # Posts this admin answered go back to the moderation queue
+    db.session.execute(
+        update(Post)
+        .where(
+            Post.id.in_(
+                select(AdminResponse.post_id).where(AdminResponse.admin_id == user_id)
+            )
+        )
+        .values(moderation_status="pending")
+        .execution_options(synchronize_session=False)
+    )
+    _bulk_delete(AdminResponse, AdminResponse.admin_id == user_id)
+    recent_feed.changed(campus_id)
+
+    report_ids = select(SecurityReport.id).where(SecurityReport.user_id == user_id)
+    _bulk_delete(ChatMessage, ChatMessage.security_report_id.in_(report_ids))
+    _bulk_delete(ChatMessage, ChatMessage.user_id == user_id)
+    trends.forget_reports(SecurityReport.user_id == user_id)
+    _bulk_delete(SecurityReport, SecurityReport.user_id == user_id)
+    _bulk_delete(EscortRequest, EscortRequest.user_id == user_id)
+    _bulk_delete(User, User.id == user_id)
+    db.session.commit()
+
+    touched = list(touched)
+    for batch in _batches(touched):
+        recent_feed.counts_changed(campus_id, batch)
+        ranking.recount_posts(batch)
+
+
+def start_user_deletion(app, user):
+    """Queue a background deletion; the user is locked out meanwhile.
+
+    Every request re-reads the session user's role (``load_session_role``
+    in app.py), so sessions of a "deleting" user are cleared.
+    """
+    job = DeletionJob(user_id=user.id, user_email=user.email)
+    user.role = "deleting"
+    db.session.add(job)
+    db.session.commit()
+    deletion_executor.submit(run_deletion_job, app, job.id)
+    return job
+
+
+def run_deletion_job(app, job_id):
+    with app.app_context():
+        job = db.session.get(DeletionJob, job_id)
+        job.status = "running"
+        db.session.commit()
+        try:
+            purge_user(job.user_id, commit_batches=True)
+            job = db.session.get(DeletionJob, job_id)
+            job.status = "done"
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error("Deletion job %s failed: %s", job_id, e)
+            job = db.session.get(DeletionJob, job_id)
+            job.status = "failed"
+            job.error = str(e)[:500]
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+
+
+def resume_deletion_jobs(app):
+    """Requeue jobs that were interrupted by a restart (deletes are idempotent)."""
+    jobs = DeletionJob.query.filter(
+        DeletionJob.status.in_(["pending", "running"])
+    ).all()
+    for job in jobs:
+        deletion_executor.submit(run_deletion_job, app, job.id)
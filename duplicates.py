@@ -0,0 +1,245 @@
+"""Near-duplicate post detection with MinHash signatures and an LSH index.
+
+A post's text is lowercased, stripped of punctuation and cut into
+overlapping character shingles. SIGNATURE_SIZE hash functions reduce the
+shingle set to a MinHash signature; the fraction of positions where two
+signatures agree estimates the Jaccard similarity of the two texts. The
+signature is split into LSH_BANDS bands, and posts sharing a band (within a
+campus) share a bucket, so finding candidates is one dict lookup per band
+whatever the number of posts.
+
+The index keeps the last DUPLICATE_WINDOW_DAYS of posts, at most
+DUPLICATE_MAX_POSTS of them, in memory. It is built at startup from the
+newest posts, updated by create_post and deletion.delete_posts, and before
+each lookup picks up posts other workers created: it re-reads the ids from
+RESCAN_IDS below the highest one it has seen, since a post can commit
+after a higher id did, and indexes the ones it lacks. Posts deleted by
+other workers drop out when the candidates are loaded.
+"""
+
+import os
+import re
+import threading
+import zlib
+from collections import deque
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from config import db
+from models import Post
+import tenancy
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency
+    np = None
+
+DUPLICATE_DETECTION = os.getenv("DUPLICATE_DETECTION", "1") == "1"
+DUPLICATE_THRESHOLD = float(os.getenv("DUPLICATE_THRESHOLD", "0.5"))
+DUPLICATE_LINK_THRESHOLD = float(os.getenv("DUPLICATE_LINK_THRESHOLD", "0.8"))
+DUPLICATE_WINDOW_DAYS = int(os.getenv("DUPLICATE_WINDOW_DAYS", "90"))
+DUPLICATE_MAX_POSTS = int(os.getenv("DUPLICATE_MAX_POSTS", "50000"))
+
+SHINGLE_SIZE = 4
+LSH_BANDS = 16
+LSH_ROWS = 4
+SIGNATURE_SIZE = LSH_BANDS * LSH_ROWS
+# Fixed seed: signatures must agree across workers and restarts
+SEED = 20240601
+BATCH_SIZE = 1000
+# Posts committed out of id order within this many ids are still picked up
+RESCAN_IDS = 1000
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+if np is not None:
+    _rng = np.random.default_rng(SEED)
+    # Multiply-shift hashing: h(x) = ((a * x + b) mod 2**64) >> 32, a odd
+    _A = _rng.integers(0, 2**63, SIGNATURE_SIZE, dtype=np.uint64) * 2 + 1
+    _B = _rng.integers(0, 2**63, SIGNATURE_SIZE, dtype=np.uint64)
+
+
+def is_enabled():
+    return DUPLICATE_DETECTION and np is not None
+
+
+def shingles(text):
+    normalized = " ".join(TOKEN_RE.findall(text.lower()))
+    if len(normalized) <= SHINGLE_SIZE:
+        return {normalized}
+    return {
+        normalized[i : i + SHINGLE_SIZE]
+        for i in range(len(normalized) - SHINGLE_SIZE + 1)
+    }
+
+
+def signature(text):
+    """MinHash signature of ``text``: SIGNATURE_SIZE uint32 values."""
+    hashes = np.fromiter((zlib.crc32(s.encode()) for s in shingles(text)), np.uint64)
+    mixed = (_A[:, None] * hashes[None, :] + _B[:, None]) >> np.uint64(32)
+    return mixed.min(axis=1).astype(np.uint32)
+
+
+def band_keys(campus_id, sig):
+    return [
+        (campus_id, sig[b * LSH_ROWS : (b + 1) * LSH_ROWS].tobytes())
+        for b in range(LSH_BANDS)
+    ]
+
+
+class DuplicateIndex:
+    def __init__(self, window, max_posts):
+        self.window = window
+        self.max_posts = max_posts
+        # post_id -> (campus_id, signature)
+        self.posts = {}
+        # One dict per band: (campus_id, band bytes) -> set of post ids
+        self.buckets = [{} for _ in range(LSH_BANDS)]
+        # (created_at, post_id) in insertion order, for eviction
+        self.order = deque()
+        self.last_id = 0
+        self.built = False
+        self._lock = threading.Lock()
+
+    def add(self, post_id, campus_id, created_at, sig):
+        with self._lock:
+            self.last_id = max(self.last_id, post_id)
+            if post_id in self.posts:
+                return
+            self.posts[post_id] = (campus_id, sig)
+            for band, key in enumerate(band_keys(campus_id, sig)):
+                self.buckets[band].setdefault(key, set()).add(post_id)
+            self.order.append((created_at or datetime.utcnow(), post_id))
+            self._evict()
+
+    def remove(self, post_ids):
+        with self._lock:
+            for post_id in post_ids:
+                self._remove(post_id)
+
+    def _remove(self, post_id):
+        entry = self.posts.pop(post_id, None)
+        if entry is None:
+            return
+        for band, key in enumerate(band_keys(*entry)):
+            bucket = self.buckets[band].get(key)
+            if bucket is not None:
+                bucket.discard(post_id)
+                if not bucket:
+                    del self.buckets[band][key]
+
+    def _evict(self):
+        cutoff = datetime.utcnow() - self.window
+        while self.order and (
+            len(self.posts) > self.max_posts or self.order[0][0] < cutoff
+        ):
+            # Entries of removed posts are skipped here
+            self._remove(self.order.popleft()[1])
+
+    def missing(self, post_ids):
+        with self._lock:
+            return [post_id for post_id in post_ids if post_id not in self.posts]
+
+    def query(self, campus_id, sig, exclude=None):
+        """[(post_id, estimated similarity)] above the threshold, best first."""
+        with self._lock:
+            candidates = set()
+            for band, key in enumerate(band_keys(campus_id, sig)):
+                candidates |= self.buckets[band].get(key, set())
+            candidates.discard(exclude)
+            scored = [
+                (post_id, float(np.mean(self.posts[post_id][1] == sig)))
+                for post_id in candidates
+            ]
+        return sorted(
+            (s for s in scored if s[1] >= DUPLICATE_THRESHOLD),
+            key=lambda s: (-s[1], -s[0]),
+        )
+
+    def stats(self):
+        with self._lock:
+            return {
+                "posts": len(self.posts),
+                "buckets": sum(len(b) for b in self.buckets),
+                "last_id": self.last_id,
+            }
+
+
+index = DuplicateIndex(timedelta(days=DUPLICATE_WINDOW_DAYS), DUPLICATE_MAX_POSTS)
+
+
+def _load(rows):
+    for post_id, campus_id, created_at, content in rows:
+        index.add(post_id, campus_id, created_at, signature(content))
+
+
+def build():
+    """Index the newest posts (a primary-key range, not a table scan)."""
+    if not is_enabled():
+        return 0
+    cutoff = datetime.utcnow() - index.window
+    with tenancy.unscoped():
+        rows = db.session.execute(
+            select(Post.id, Post.campus_id, Post.created_at, Post.content)
+            .order_by(Post.id.desc())
+            .limit(index.max_posts)
+        ).all()
+    _load(row for row in reversed(rows) if row.created_at and row.created_at >= cutoff)
+    index.built = True
+    return len(index.posts)
+
+
+def catch_up():
+    """Index posts created since the last lookup, by any worker."""
+    if not index.built:
+        build()
+        return
+    with tenancy.unscoped():
+        post_ids = db.session.scalars(
+            select(Post.id).where(Post.id > index.last_id - RESCAN_IDS)
+        ).all()
+        missing = index.missing(post_ids)
+        for start in range(0, len(missing), BATCH_SIZE):
+            _load(
+                db.session.execute(
+                    select(Post.id, Post.campus_id, Post.created_at, Post.content)
+                    .where(Post.id.in_(missing[start : start + BATCH_SIZE]))
+                    .order_by(Post.id)
+                ).all()
+            )
+
+
+def find_similar(content, campus_id, exclude=None, limit=5):
+    """Recent posts of the campus similar to ``content``: [(Post, similarity)]."""
+    if not is_enabled():
+        return []
+    catch_up()
+    matches = index.query(campus_id, signature(content), exclude)[:limit]
+    if not matches:
+        return []
+    posts = {
+        p.id: p
+        for p in Post.query.filter(Post.id.in_([post_id for post_id, _ in matches]))
+    }
+    # Deleted by another worker since it was indexed
+    index.remove([post_id for post_id, _ in matches if post_id not in posts])
+    return [(posts[post_id], score) for post_id, score in matches if post_id in posts]
+
+
+def link_target(similar):
+    """The post a new post duplicates, if the best match is close enough."""
+    if similar and similar[0][1] >= DUPLICATE_LINK_THRESHOLD:
+        return similar[0][0].id
+    return None
+
+
+def add(post):
+    """Index a committed post."""
+    if is_enabled():
+        index.add(post.id, post.campus_id, post.created_at, signature(post.content))
+
+
+def forget(post_ids):
+    if is_enabled():
+        index.remove(post_ids)
@@ -0,0 +1,318 @@
+"""Offline hotspot detection over historical security reports.
+
+Reports are binned per campus and type onto a grid of HOTSPOT_CELL_METERS
+squares (equirectangular around each campus's latitude) and the per-cell
+aggregates (count, coordinate sums, local hour-of-day histogram, weekly
+counts) are kept in ``hotspot_cell``. Each run bins only reports added since the last
+one, tracked by a ``job_watermark`` row, so the table is never rescanned.
+Ids are assigned at insert but become visible at commit, so a report can
+appear below ids already binned; each run re-reads the last RESCAN_IDS ids
+and skips the ones the watermark lists as binned.
+
+Clustering is density-based on the grid, a DBSCAN with the cell as the
+neighbourhood: a cell is a core cell when it and its 8 neighbours hold at
+least HOTSPOT_MIN_REPORTS reports, adjacent core cells join one hotspot and
+non-core cells next to a core cell are attached to it. The cost grows with
+the number of occupied cells, not with the square of the number of reports.
+
+Aggregates are additive, so deleted reports are not subtracted; run with
+``rebuild`` (``flask --app app hotspots --rebuild``) to recount from scratch.
+Changing the cell size, the campus latitude or CAMPUS_UTC_OFFSET also
+triggers a rebuild.
+"""
+
+import math
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, select
+
+from config import CAMPUS_UTC_OFFSET, db
+from models import (
+    Hotspot,
+    HotspotCell,
+    JobWatermark,
+    SecurityReport,
+    UniversitySettings,
+)
+import tenancy
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency
+    np = None
+
+HOTSPOT_CELL_METERS = float(os.getenv("HOTSPOT_CELL_METERS", "50"))
+HOTSPOT_MIN_REPORTS = int(os.getenv("HOTSPOT_MIN_REPORTS", "5"))
+HOTSPOT_TREND_WEEKS = int(os.getenv("HOTSPOT_TREND_WEEKS", "4"))
+METERS_PER_DEGREE = 111_320
+KEEP_WEEKS = 52
+BATCH_SIZE = 5000
+# Covers transactions in flight while later ones commit (an ingest batch is one)
+RESCAN_IDS = 5000
+# Offsets of a cell's 3x3 neighbourhood, itself first
+NEIGHBOURS = [(0, 0)] + [
+    (dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1) if (dx, dy) != (0, 0)
+]
+
+
+def grid_params():
+    return {
+        "cell_m": HOTSPOT_CELL_METERS,
+        "utc_offset": CAMPUS_UTC_OFFSET,
+        "ref_lats": {
+            str(campus_id): round(latitude or 0.0, 1)
+            for campus_id, latitude in db.session.execute(
+                select(UniversitySettings.id, UniversitySettings.latitude)
+            )
+        },
+    }
+
+
+def week_number(local_time):
+    # Weeks since the Monday before the epoch
+    return (local_time - datetime(1969, 12, 29)).days // 7
+
+
+def bin_reports(rows, params):
+    """Aggregate report rows per (campus_id, type, cell_x, cell_y)."""
+    groups = sorted({(r.campus_id, r.type) for r in rows})
+    group_codes = {g: i for i, g in enumerate(groups)}
+    cos_lat = {
+        int(campus_id): math.cos(math.radians(lat))
+        for campus_id, lat in params["ref_lats"].items()
+    }
+    lat = np.fromiter((r.latitude for r in rows), float, len(rows))
+    lon = np.fromiter((r.longitude for r in rows), float, len(rows))
+    offset = timedelta(hours=params["utc_offset"])
+    local = [r.created_at + offset for r in rows]
+    hour = np.fromiter((t.hour for t in local), np.int64, len(rows))
+    week = np.fromiter((week_number(t) for t in local), np.int64, len(rows))
+    code = np.fromiter(
+        (group_codes[(r.campus_id, r.type)] for r in rows), np.int64, len(rows)
+    )
+    scale = np.fromiter((cos_lat.get(r.campus_id, 1.0) for r in rows), float, len(rows))
+
+    cell_deg = params["cell_m"] / METERS_PER_DEGREE
+    cell_y = np.floor(lat / cell_deg).astype(np.int64)
+    cell_x = np.floor(lon * scale / cell_deg).astype(np.int64)
+
+    keys, inverse, counts = np.unique(
+        np.stack([code, cell_x, cell_y], axis=1),
+        axis=0,
+        return_inverse=True,
+        return_counts=True,
+    )
+    inverse = inverse.reshape(-1)
+    sum_lat = np.bincount(inverse, weights=lat, minlength=len(keys))
+    sum_lon = np.bincount(inverse, weights=lon, minlength=len(keys))
+    hours = np.zeros((len(keys), 24), np.int64)
+    np.add.at(hours, (inverse, hour), 1)
+    week_keys, week_counts = np.unique(
+        np.stack([inverse, week], axis=1), axis=0, return_counts=True
+    )
+    weeks = [{} for _ in keys]
+    for (i, w), n in zip(week_keys.tolist(), week_counts.tolist()):
+        weeks[i][str(w)] = n
+
+    return {
+        (*groups[c], x, y): (int(n), float(sl), float(so), h, wk)
+        for (c, x, y), n, sl, so, h, wk in zip(
+            keys.tolist(),
+            counts,
+            sum_lat,
+            sum_lon,
+            hours.tolist(),
+            weeks,
+        )
+    }
+
+
+def merge_cells(binned, cells, current_week):
+    for key, (count, sum_lat, sum_lon, hours, weeks) in binned.items():
+        cell = cells.get(key)
+        if cell is None:
+            cell = cells[key] = HotspotCell(
+                campus_id=key[0],
+                type=key[1],
+                cell_x=key[2],
+                cell_y=key[3],
+                count=0,
+                sum_lat=0.0,
+                sum_lon=0.0,
+                hours=[0] * 24,
+                weeks={},
+            )
+            db.session.add(cell)
+        cell.count += count
+        cell.sum_lat += sum_lat
+        cell.sum_lon += sum_lon
+        cell.hours = [a + b for a, b in zip(cell.hours, hours)]
+        merged = dict(cell.weeks)
+        for week, n in weeks.items():
+            merged[week] = merged.get(week, 0) + n
+        cell.weeks = {
+            w: n for w, n in merged.items() if int(w) > current_week - KEEP_WEEKS
+        }
+
+
+def cluster(cells, min_reports):
+    """Label grid cells of one type; returns an array of labels (-1 = noise)."""
+    x = np.array([c.cell_x for c in cells], np.int64)
+    y = np.array([c.cell_y for c in cells], np.int64)
+    counts = np.array([c.count for c in cells], np.int64)
+    # Encode cells as sortable integers; the margin keeps neighbours in range
+    x0, y0 = x.min() - 1, y.min() - 1
+    height = y.max() - y0 + 2
+    encoded = (x - x0) * height + (y - y0)
+    order = np.argsort(encoded)
+    sorted_keys = encoded[order]
+
+    # neighbour[k][i]: index of cell i's k-th neighbour, or -1
+    neighbour = np.full((len(NEIGHBOURS), len(cells)), -1, np.int64)
+    for k, (dx, dy) in enumerate(NEIGHBOURS):
+        target = encoded + dx * height + dy
+        pos = np.clip(np.searchsorted(sorted_keys, target), 0, len(cells) - 1)
+        found = sorted_keys[pos] == target
+        neighbour[k, found] = order[pos[found]]
+
+    density = np.where(neighbour >= 0, counts[neighbour], 0).sum(axis=0)
+    core = density >= min_reports
+
+    # Propagate the smallest index through adjacent core cells
+    labels = np.where(core, np.arange(len(cells)), len(cells))
+    while True:
+        candidates = np.where(
+            (neighbour >= 0) & core[neighbour], labels[neighbour], len(cells)
+        )
+        updated = np.where(core, np.minimum(labels, candidates.min(axis=0)), labels)
+        if np.array_equal(updated, labels):
+            break
+        labels = updated
+
+    # Border cells join the lowest-labelled adjacent core cell
+    border_label = np.where(
+        (neighbour >= 0) & core[neighbour], labels[neighbour], len(cells)
+    ).min(axis=0)
+    labels = np.where(core, labels, border_label)
+    return np.where(labels < len(cells), labels, -1)
+
+
+def build_hotspots(cells_by_group, now=None):
+    now = now or datetime.utcnow()
+    current_week = week_number(now + timedelta(hours=CAMPUS_UTC_OFFSET))
+    recent_weeks = range(current_week - HOTSPOT_TREND_WEEKS + 1, current_week + 1)
+    previous_weeks = range(
+        current_week - 2 * HOTSPOT_TREND_WEEKS + 1,
+        current_week - HOTSPOT_TREND_WEEKS + 1,
+    )
+    hotspots = []
+    for (campus_id, report_type), cells in cells_by_group.items():
+        labels = cluster(cells, HOTSPOT_MIN_REPORTS)
+        groups = {}
+        for cell, label in zip(cells, labels.tolist()):
+            if label >= 0:
+                groups.setdefault(label, []).append(cell)
+        ranked = sorted(groups.values(), key=lambda g: -sum(c.count for c in g))
+        for rank, group in enumerate(ranked, 1):
+            count = sum(c.count for c in group)
+            lat = sum(c.sum_lat for c in group) / count
+            lon = sum(c.sum_lon for c in group) / count
+            # Farthest cell centroid from the hotspot centre, plus half a cell
+            radius = max(
+                math.hypot(
+                    (c.sum_lat / c.count - lat) * METERS_PER_DEGREE,
+                    (c.sum_lon / c.count - lon)
+                    * METERS_PER_DEGREE
+                    * math.cos(math.radians(lat)),
+                )
+                for c in group
+            ) + (HOTSPOT_CELL_METERS / 2)
+            recent = sum(c.weeks.get(str(w), 0) for c in group for w in recent_weeks)
+            previous = sum(
+                c.weeks.get(str(w), 0) for c in group for w in previous_weeks
+            )
+            hotspots.append(
+                Hotspot(
+                    campus_id=campus_id,
+                    type=report_type,
+                    rank=rank,
+                    report_count=count,
+                    cell_count=len(group),
+                    latitude=lat,
+                    longitude=lon,
+                    radius_m=round(radius, 1),
+                    hours=[sum(h) for h in zip(*(c.hours for c in group))],
+                    recent_count=recent,
+                    previous_count=previous,
+                    trend=(
+                        round((recent - previous) / previous, 3) if previous else None
+                    ),
+                    computed_at=now,
+                )
+            )
+    return hotspots
+
+
+def run_hotspots(rebuild=False):
+    """Bin reports added since the last run and recompute the ranked hotspots."""
+    if np is None:
+        raise RuntimeError("Hotspot detection needs numpy")
+    # The job covers every campus, even when an admin request triggers it
+    with tenancy.unscoped():
+        return _run_hotspots(rebuild)
+
+
+def _run_hotspots(rebuild):
+    now = datetime.utcnow()
+    params = grid_params()
+    mark = db.session.get(JobWatermark, "hotspots")
+    if mark is None:
+        mark = JobWatermark(name="hotspots", last_id=0)
+        db.session.add(mark)
+    if rebuild or mark.params != params:
+        db.session.execute(delete(HotspotCell))
+        mark.last_id = 0
+        mark.recent_ids = []
+    mark.params = params
+    mark.updated_at = now
+
+    cells = {(c.campus_id, c.type, c.cell_x, c.cell_y): c for c in HotspotCell.query}
+    current_week = week_number(now + timedelta(hours=CAMPUS_UTC_OFFSET))
+    binned_reports = 0
+    binned = set(mark.recent_ids or ())
+    after = max(mark.last_id - RESCAN_IDS, 0)
+    while True:
+        rows = db.session.execute(
+            select(
+                SecurityReport.id,
+                SecurityReport.campus_id,
+                SecurityReport.type,
+                SecurityReport.latitude,
+                SecurityReport.longitude,
+                SecurityReport.created_at,
+            )
+            .where(SecurityReport.id > after)
+            .order_by(SecurityReport.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        after = rows[-1].id
+        fresh = [row for row in rows if row.id not in binned]
+        if fresh:
+            merge_cells(bin_reports(fresh, params), cells, current_week)
+        binned.update(row.id for row in fresh)
+        binned = {i for i in binned if i > after - RESCAN_IDS}
+        binned_reports += len(fresh)
+    mark.last_id = max(mark.last_id, after)
+    mark.recent_ids = sorted(i for i in binned if i > mark.last_id - RESCAN_IDS)
+
+    cells_by_group = {}
+    for cell in cells.values():
+        cells_by_group.setdefault((cell.campus_id, cell.type), []).append(cell)
+    hotspots = build_hotspots(cells_by_group, now)
+    db.session.execute(delete(Hotspot))
+    db.session.add_all(hotspots)
+    db.session.commit()
+    return {"reports_binned": binned_reports, "hotspots": len(hotspots)}
@@ -0,0 +1,237 @@
+"""Bulk ingestion of security reports from partner systems.
+
+Partners (camera and patrol systems) authenticate with a bearer token made
+by ``flask --app app create-api-client NAME``; only its SHA-256 is stored
+and the token belongs to one campus. The body is NDJSON, one report per
+line:
+
+    {"type": "theft", "description": "...", "latitude": -1.28,
+     "longitude": 36.82, "occurred_at": "2026-03-01T18:04:05Z",
+     "external_id": "cam-7/000123"}
+
+Lines are read from the request stream one at a time, so memory does not
+grow with the body. Valid rows are inserted INGEST_BATCH_SIZE at a time,
+one multi-row INSERT and one commit per batch, and counted into the
+incident trends in the same transaction. Every line gets a result:
+created (with the report id), duplicate, or error (with the reason).
+
+A row whose ``external_id`` this client already sent is a duplicate and is
+not inserted again, so a partner can resend a batch after a timeout.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import secrets
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import insert, select
+from sqlalchemy.exc import SQLAlchemyError
+
+from config import db
+from models import DEFAULT_CAMPUS_ID, ApiClient, SecurityReport
+import trends
+import zones
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "500"))
+INGEST_MAX_ROWS = int(os.getenv("INGEST_MAX_ROWS", "100000"))
+INGEST_MAX_LINE_BYTES = 16 * 1024
+# Clock skew tolerated on occurred_at
+MAX_FUTURE = timedelta(minutes=5)
+
+_loads = orjson.loads if orjson else json.loads
+
+logger = logging.getLogger(__name__)
+
+
+class RowError(ValueError):
+    pass
+
+
+def hash_token(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def create_client(name, campus_id=DEFAULT_CAMPUS_ID):
+    """Register a partner; returns (client, token). The token is not stored."""
+    token = secrets.token_urlsafe(32)
+    client = ApiClient(name=name, campus_id=campus_id, token_hash=hash_token(token))
+    db.session.add(client)
+    db.session.commit()
+    return client, token
+
+
+def authenticate(header):
+    """The active client for an ``Authorization: Bearer <token>`` header."""
+    scheme, _, token = (header or "").partition(" ")
+    if scheme.lower() != "bearer" or not token.strip():
+        return None
+    return ApiClient.query.filter_by(
+        token_hash=hash_token(token.strip()), active=True
+    ).first()
+
+
+def read_lines(stream, max_bytes=INGEST_MAX_LINE_BYTES):
+    """Yield the stream's lines; a line longer than max_bytes yields None."""
+    while True:
+        line = stream.readline(max_bytes + 1)
+        if not line:
+            return
+        if len(line) > max_bytes:
+            # Skip the rest of the oversized line
+            while line and not line.endswith(b"\n"):
+                line = stream.readline(max_bytes + 1)
+            yield None
+        else:
+            yield line
+
+
+def _text(data, name, max_length, required=True):
+    value = data.get(name)
+    if value is None and not required:
+        return None
+    if not isinstance(value, str) or not value.strip():
+        raise RowError(f"{name} must be a non-empty string")
+    if len(value) > max_length:
+        raise RowError(f"{name} is longer than {max_length} characters")
+    return value.strip()
+
+
+def _coordinate(data, name, limit):
+    value = data.get(name)
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise RowError(f"{name} must be a number")
+    if not -limit <= value <= limit:
+        raise RowError(f"{name} is out of range")
+    return float(value)
+
+
+def _timestamp(value, now):
+    if value is None:
+        return now
+    try:
+        ts = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except (AttributeError, ValueError):
+        raise RowError("occurred_at must be an ISO 8601 timestamp")
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    if ts > now + MAX_FUTURE:
+        raise RowError("occurred_at is in the future")
+    return ts
+
+
+def parse_row(line, now):
+    try:
+        data = _loads(line)
+    except ValueError:
+        raise RowError("invalid JSON")
+    if not isinstance(data, dict):
+        raise RowError("expected a JSON object")
+    return {
+        "type": _text(data, "type", 50),
+        "description": _text(data, "description", 500),
+        "latitude": _coordinate(data, "latitude", 90),
+        "longitude": _coordinate(data, "longitude", 180),
+        "created_at": _timestamp(data.get("occurred_at"), now),
+        "external_id": _text(data, "external_id", 100, required=False),
+    }
+
+
+def _insert_batch(client, batch):
+    """Insert one batch of (line, row) and commit; returns their results."""
+    external_ids = {row["external_id"] for _, row in batch if row["external_id"]}
+    seen = set()
+    if external_ids:
+        seen = set(
+            db.session.scalars(
+                select(SecurityReport.external_id).where(
+                    SecurityReport.source_id == client.id,
+                    SecurityReport.external_id.in_(external_ids),
+                )
+            )
+        )
+    results, lines, rows = [], [], []
+    for line, row in batch:
+        external_id = row["external_id"]
+        if external_id in seen:
+            results.append(
+                {"line": line, "status": "duplicate", "external_id": external_id}
+            )
+            continue
+        if external_id:
+            seen.add(external_id)
+        lines.append(line)
+        rows.append(
+            {
+                **row,
+                "campus_id": client.campus_id,
+                "source_id": client.id,
+                "zone_id": zones.zone_for(
+                    client.campus_id, row["latitude"], row["longitude"]
+                ),
+            }
+        )
+    if not rows:
+        return results
+
+    try:
+        ids = db.session.scalars(
+            insert(SecurityReport).returning(
+                SecurityReport.id, sort_by_parameter_order=True
+            ),
+            rows,
+        ).all()
+        trends.record_reports(
+            client.campus_id, [(r["type"], r["created_at"]) for r in rows]
+        )
+        db.session.commit()
+    except SQLAlchemyError as e:
+        # e.g. the same external_id arriving concurrently; a retry sorts it out
+        db.session.rollback()
+        logger.warning("Ingest batch from client %s failed: %s", client.id, e)
+        results.extend(
+            {"line": line, "status": "error", "error": "not stored, retry"}
+            for line in lines
+        )
+    else:
+        results.extend(
+            {"line": line, "status": "created", "id": report_id}
+            for line, report_id in zip(lines, ids)
+        )
+    return results
+
+
+def ingest(client, lines):
+    """Validate and insert NDJSON lines; returns one result per non-blank line."""
+    now = datetime.utcnow()
+    results, batch = [], []
+    for number, line in enumerate(lines, 1):
+        if line is not None and not line.strip():
+            continue
+        if number > INGEST_MAX_ROWS:
+            results.append(
+                {"line": number, "status": "error", "error": "too many rows"}
+            )
+            break
+        try:
+            if line is None:
+                raise RowError(f"line is longer than {INGEST_MAX_LINE_BYTES} bytes")
+            batch.append((number, parse_row(line, now)))
+        except RowError as e:
+            results.append({"line": number, "status": "error", "error": str(e)})
+        if len(batch) >= INGEST_BATCH_SIZE:
+            results.extend(_insert_batch(client, batch))
+            batch = []
+    if batch:
+        results.extend(_insert_batch(client, batch))
+
+    client.last_used_at = now
+    db.session.commit()
+    results.sort(key=lambda r: r["line"])
+    return results
@@ -0,0 +1,80 @@
+"""JSON provider used for every response (``app.json``).
+
+Uses orjson when it is installed and falls back to the stdlib encoder
+otherwise. Either way datetimes are written in one canonical form: ISO 8601
+in UTC with a ``Z`` suffix (naive datetimes are taken to be UTC, which is
+what ``datetime.utcnow`` stores), e.g. ``2026-01-31T18:04:05.123456Z``.
+"""
+
+import dataclasses
+import decimal
+import json
+import uuid
+from datetime import date, datetime, timezone
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+
+def format_datetime(value):
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.isoformat() + "Z"
+
+
+def _default(o):
+    if isinstance(o, datetime):
+        return format_datetime(o)
+    if isinstance(o, date):
+        return o.isoformat()
+    if isinstance(o, (decimal.Decimal, uuid.UUID)):
+        return str(o)
+    if dataclasses.is_dataclass(o) and not isinstance(o, type):
+        return dataclasses.asdict(o)
+    if hasattr(o, "__html__"):
+        return str(o.__html__())
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson when available."""
+
+    sort_keys = False
+    backend = "orjson" if orjson else "json"
+
+    if orjson:
+        _options = orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+        def dumpb(self, obj):
+            return orjson.dumps(obj, default=_default, option=self._options)
+
+    else:
+
+        def dumpb(self, obj):
+            return json.dumps(
+                obj, default=_default, ensure_ascii=False, separators=(",", ":")
+            ).encode()
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            # Formatting options (indent, sort_keys...) need the stdlib encoder
+            kwargs.setdefault("default", _default)
+            return json.dumps(obj, **kwargs)
+        return self.dumpb(obj).decode()
+
+    def loads(self, s, **kwargs):
+        if orjson and not kwargs:
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        if self._app.debug and self.compact is None:
+            body = self.dumps(obj, indent=2, ensure_ascii=False) + "\n"
+        else:
+            body = self.dumpb(obj) + b"\n"
+        return self._app.response_class(body, mimetype=self.mimetype)
@@ -0,0 +1,129 @@
+"""Queue-based structured logging.
+
+Loggers only build a LogRecord and put it on a queue; a listener thread
+formats it and writes to stderr, so request threads never wait on the
+stream. Messages use lazy ``%s`` arguments and structured fields go in
+``extra``, e.g. ``app.logger.info("login attempt", extra={"email": email})``.
+Both are rendered on the listener thread as ``key=value`` pairs (or one JSON
+object per line with LOG_FORMAT=json).
+
+Info and debug records can be sampled per endpoint with LOG_SAMPLE, e.g.
+``LOG_SAMPLE=add_reaction=0.01,get_posts=0.1``. If the listener falls
+LOG_QUEUE_MAX records behind, further info/debug records are dropped until
+it catches up. Warnings and errors are never sampled or dropped.
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import has_request_context, request
+from flask.logging import default_handler
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "kv")  # kv | json
+LOG_QUEUE_MAX = int(os.getenv("LOG_QUEUE_MAX", "10000"))
+LOG_SAMPLE = {
+    endpoint.strip(): float(rate)
+    for endpoint, _, rate in (
+        item.partition("=") for item in os.getenv("LOG_SAMPLE", "").split(",")
+    )
+    if endpoint.strip() and rate
+}
+
+# Attributes every LogRecord has; anything else came in through ``extra``
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+def record_fields(record):
+    return {k: v for k, v in vars(record).items() if k not in _RECORD_ATTRS}
+
+
+class KeyValueFormatter(logging.Formatter):
+    def format(self, record):
+        fields = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc)
+            .isoformat(timespec="milliseconds")
+            .replace("+00:00", "Z"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            **record_fields(record),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            fields["exc"] = record.exc_text
+        if LOG_FORMAT == "json":
+            return json.dumps(fields, default=str)
+        return " ".join(f"{k}={_quote(v)}" for k, v in fields.items())
+
+
+def _quote(value):
+    value = str(value)
+    if not value or any(c in value for c in ' ="\n'):
+        return json.dumps(value)
+    return value
+
+
+class SamplingQueueHandler(QueueHandler):
+    """Enqueues records unformatted, sampling and shedding only info and below."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.sampled_out = 0
+        self.shed = 0
+        self._lock = threading.Lock()
+
+    def prepare(self, record):
+        # The default formats the message here, on the caller's thread.
+        # Only tracebacks are rendered early; they pin frames otherwise.
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def handle(self, record):
+        if record.levelno < logging.WARNING:
+            endpoint = request.endpoint if has_request_context() else None
+            rate = LOG_SAMPLE.get(endpoint, 1.0)
+            if rate < 1.0 and random.random() >= rate:
+                self._count("sampled_out")
+                return False
+            if self.queue.qsize() >= LOG_QUEUE_MAX:
+                self._count("shed")
+                return False
+            if endpoint and rate < 1.0:
+                record.sample_rate = rate
+        if has_request_context() and not hasattr(record, "endpoint"):
+            record.endpoint = request.endpoint
+        return super().handle(record)
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+
+def init_logging(app):
+    """Route all logging through the queue (call before anything logs)."""
+    log_queue = queue.SimpleQueue()
+    stream = logging.StreamHandler()
+    stream.setFormatter(KeyValueFormatter())
+    listener = QueueListener(log_queue, stream, respect_handler_level=True)
+
+    root = logging.getLogger()
+    root.handlers[:] = [SamplingQueueHandler(log_queue)]
+    root.setLevel(LOG_LEVEL)
+    app.logger.removeHandler(default_handler)
+    app.logger.setLevel(LOG_LEVEL)
+
+    listener.start()
+    # Drains what is still queued before the interpreter exits
+    atexit.register(listener.stop)
+    return listener
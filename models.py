@@ -2,26 +2,56 @@ from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
 from config import db
 
+DEFAULT_CAMPUS_ID = 1
 
-class User(db.Model):
+
+class CampusScoped:
+    """Rows that belong to one campus; queries are filtered by tenancy.py."""
+
+    # university_settings.id; no FK so the column can be added to live tables
+    campus_id = db.Column(
+        db.Integer, default=DEFAULT_CAMPUS_ID, server_default="1", nullable=False
+    )
+
+
+class User(CampusScoped, db.Model):
     __tablename__ = "user"
 
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String, unique=True, nullable=False)
     password_hash = db.Column(db.String, nullable=False)
     role = db.Column(db.String, default="student")  # student | admin
-
-    posts = db.relationship("Post", back_populates="user", cascade="all, delete-orphan")
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    # Deletes are done set-based (see deletion.py) and by ON DELETE CASCADE,
+    # so the ORM must not load children just to delete them.
+    posts = db.relationship(
+        "Post",
+        back_populates="user",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
     comments = db.relationship(
-        "Comment", back_populates="user", cascade="all, delete-orphan"
+        "Comment",
+        back_populates="user",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
     )
     reactions = db.relationship(
-        "Reaction", back_populates="user", cascade="all, delete-orphan"
+        "Reaction",
+        back_populates="user",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
     )
     admin_responses = db.relationship(
-        "AdminResponse", back_populates="admin", cascade="all, delete-orphan"
+        "AdminResponse",
+        back_populates="admin",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
     )
 
+    __table_args__ = (db.Index("ix_user_campus_created", "campus_id", "created_at"),)
+
     def set_password(self, pw):
         self.password_hash = generate_password_hash(pw)
 
@@ -29,8 +59,7 @@ class User(db.Model):
         return check_password_hash(self.password_hash, pw)
 
 
-
-class Category(db.Model):
+class Category(CampusScoped, db.Model):
     __tablename__ = "category"
 
     id = db.Column(db.Integer, primary_key=True)
@@ -39,9 +68,10 @@ class Category(db.Model):
 
     posts = db.relationship("Post", back_populates="category")
 
+    __table_args__ = (db.Index("ix_category_campus_name", "campus_id", "name"),)
 
 
-class Post(db.Model):
+class Post(CampusScoped, db.Model):
     __tablename__ = "post"
 
     id = db.Column(db.Integer, primary_key=True)
@@ -49,22 +79,72 @@ class Post(db.Model):
     images = db.Column(db.JSON, default=[])  # Array of image URLs
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
-    user_id = db.Column(db.Integer, db.ForeignKey("user.id"))
+    # Denormalised counters, kept in step by the reaction/comment endpoints
+    likes_count = db.Column(db.Integer, default=0, server_default="0", nullable=False)
+    dislikes_count = db.Column(
+        db.Integer, default=0, server_default="0", nullable=False
+    )
+    comments_count = db.Column(
+        db.Integer, default=0, server_default="0", nullable=False
+    )
+    hot_score = db.Column(db.Float, default=0.0, server_default="0", nullable=False)
+    # pending | responded; set by respond_post so the moderation queue is an
+    # index range scan rather than an anti-join over admin_response
+    moderation_status = db.Column(
+        db.String(20), default="pending", server_default="pending", nullable=False
+    )
+
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id", ondelete="CASCADE"))
     category_id = db.Column(db.Integer, db.ForeignKey("category.id"))
+    # Earlier post this one near-duplicates (see duplicates.py)
+    duplicate_of_id = db.Column(
+        db.Integer, db.ForeignKey("post.id", ondelete="SET NULL")
+    )
 
     user = db.relationship("User", back_populates="posts")
     category = db.relationship("Category", back_populates="posts")
 
     comments = db.relationship(
-        "Comment", back_populates="post", cascade="all, delete-orphan"
+        "Comment",
+        back_populates="post",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
     )
     reactions = db.relationship(
-        "Reaction", back_populates="post", cascade="all, delete-orphan"
+        "Reaction",
+        back_populates="post",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
     )
     admin_responses = db.relationship(
-        "AdminResponse", back_populates="post", cascade="all, delete-orphan"
+        "AdminResponse",
+        back_populates="post",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
     )
 
+    __table_args__ = (
+        db.Index("ix_post_user_created", "user_id", "created_at"),
+        db.Index("ix_post_campus_created", "campus_id", "created_at", "id"),
+        db.Index("ix_post_campus_hot_score", "campus_id", "hot_score", "id"),
+        db.Index("ix_post_category_hot_score", "category_id", "hot_score", "id"),
+        db.Index("ix_post_category_created", "category_id", "created_at", "id"),
+        db.Index("ix_post_duplicate_of", "duplicate_of_id"),
+        db.Index(
+            "ix_post_campus_moderation_hot",
+            "campus_id",
+            "moderation_status",
+            "hot_score",
+            "id",
+        ),
+        db.Index(
+            "ix_post_campus_moderation_created",
+            "campus_id",
+            "moderation_status",
+            "created_at",
+            "id",
+        ),
+    )
 
 
 class Comment(db.Model):
@@ -75,12 +155,17 @@ class Comment(db.Model):
     images = db.Column(db.JSON, default=[])  # Array of image URLs
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
-    user_id = db.Column(db.Integer, db.ForeignKey("user.id"))
-    post_id = db.Column(db.Integer, db.ForeignKey("post.id"))
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id", ondelete="CASCADE"))
+    post_id = db.Column(db.Integer, db.ForeignKey("post.id", ondelete="CASCADE"))
 
     user = db.relationship("User", back_populates="comments")
     post = db.relationship("Post", back_populates="comments")
 
+    __table_args__ = (
+        db.Index("ix_comment_post_created", "post_id", "created_at", "id"),
+        db.Index("ix_comment_user_created", "user_id", "created_at"),
+    )
+
 
 class Reaction(db.Model):
     __tablename__ = "reaction"
@@ -89,18 +174,20 @@ class Reaction(db.Model):
     reaction_type = db.Column(db.String(10), nullable=False)  # like | dislike
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
-    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=True)
-    post_id = db.Column(db.Integer, db.ForeignKey("post.id"))
+    user_id = db.Column(
+        db.Integer, db.ForeignKey("user.id", ondelete="CASCADE"), nullable=True
+    )
+    post_id = db.Column(db.Integer, db.ForeignKey("post.id", ondelete="CASCADE"))
 
     user = db.relationship("User", back_populates="reactions")
     post = db.relationship("Post", back_populates="reactions")
 
     __table_args__ = (
         db.UniqueConstraint("user_id", "post_id", name="unique_user_post_reaction"),
+        db.Index("ix_reaction_user_created", "user_id", "created_at"),
     )
 
 
-
 class AdminResponse(db.Model):
     __tablename__ = "admin_response"
 
@@ -108,15 +195,14 @@ class AdminResponse(db.Model):
     content = db.Column(db.String(300), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
-    post_id = db.Column(db.Integer, db.ForeignKey("post.id"))
-    admin_id = db.Column(db.Integer, db.ForeignKey("user.id"))
+    post_id = db.Column(db.Integer, db.ForeignKey("post.id", ondelete="CASCADE"))
+    admin_id = db.Column(db.Integer, db.ForeignKey("user.id", ondelete="CASCADE"))
 
     post = db.relationship("Post", back_populates="admin_responses")
     admin = db.relationship("User", back_populates="admin_responses")
 
 
-
-class SecurityReport(db.Model):
+class SecurityReport(CampusScoped, db.Model):
     __tablename__ = "security_report"
 
     id = db.Column(db.Integer, primary_key=True)
@@ -126,13 +212,37 @@ class SecurityReport(db.Model):
     longitude = db.Column(db.Float, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
-    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=True)
+    user_id = db.Column(
+        db.Integer, db.ForeignKey("user.id", ondelete="CASCADE"), nullable=True
+    )
+    # Set on reports pushed by a partner system (see ingest.py)
+    source_id = db.Column(db.Integer, db.ForeignKey("api_client.id"))
+    external_id = db.Column(db.String(100))
+    zone_id = db.Column(db.Integer, db.ForeignKey("zone.id", ondelete="SET NULL"))
 
-    user = db.relationship("User", backref="security_reports")
+    user = db.relationship(
+        "User", backref=db.backref("security_reports", passive_deletes=True)
+    )
 
+    __table_args__ = (
+        db.Index("ix_security_report_user_created", "user_id", "created_at"),
+        db.Index("ix_security_report_campus_created", "campus_id", "created_at", "id"),
+        db.Index(
+            "ix_security_report_campus_zone_created",
+            "campus_id",
+            "zone_id",
+            "created_at",
+        ),
+        db.Index(
+            "ix_security_report_source_external",
+            "source_id",
+            "external_id",
+            unique=True,
+        ),
+    )
 
 
-class EscortRequest(db.Model):
+class EscortRequest(CampusScoped, db.Model):
     __tablename__ = "escort_request"
 
     id = db.Column(db.Integer, primary_key=True)
@@ -142,9 +252,23 @@ class EscortRequest(db.Model):
     status = db.Column(db.String(20), default="active")  # active, fulfilled, expired
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
-    user_id = db.Column(db.Integer, db.ForeignKey("user.id"))
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id", ondelete="CASCADE"))
+    zone_id = db.Column(db.Integer, db.ForeignKey("zone.id", ondelete="SET NULL"))
 
-    user = db.relationship("User", backref="escort_requests")
+    user = db.relationship(
+        "User", backref=db.backref("escort_requests", passive_deletes=True)
+    )
+
+    __table_args__ = (
+        db.Index("ix_escort_request_user_created", "user_id", "created_at"),
+        db.Index("ix_escort_request_campus_created", "campus_id", "created_at", "id"),
+        db.Index(
+            "ix_escort_request_campus_zone_created",
+            "campus_id",
+            "zone_id",
+            "created_at",
+        ),
+    )
 
 
 class ChatMessage(db.Model):
@@ -154,18 +278,26 @@ class ChatMessage(db.Model):
     message = db.Column(db.String(300), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
-    security_report_id = db.Column(db.Integer, db.ForeignKey("security_report.id"))
-    user_id = db.Column(db.Integer, db.ForeignKey("user.id"))
-
-    security_report = db.relationship("SecurityReport", backref="chat_messages")
-    user = db.relationship("User", backref="chat_messages")
+    security_report_id = db.Column(
+        db.Integer, db.ForeignKey("security_report.id", ondelete="CASCADE")
+    )
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id", ondelete="CASCADE"))
 
+    security_report = db.relationship(
+        "SecurityReport", backref=db.backref("chat_messages", passive_deletes=True)
+    )
+    user = db.relationship(
+        "User", backref=db.backref("chat_messages", passive_deletes=True)
+    )
 
 
 class UniversitySettings(db.Model):
+    """One campus (tenant); ``id`` is the ``campus_id`` of its rows."""
+
     __tablename__ = "university_settings"
 
     id = db.Column(db.Integer, primary_key=True)
+    slug = db.Column(db.String(50))  # chosen with the X-Campus header
     name = db.Column(db.String(100), default="Campus University")
     latitude = db.Column(db.Float, default=-1.2921)  # Nairobi default
     longitude = db.Column(db.Float, default=36.8219)
@@ -174,4 +306,137 @@ class UniversitySettings(db.Model):
         db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow
     )
 
+    __table_args__ = (db.Index("ix_university_settings_slug", "slug", unique=True),)
+
+
+class Zone(CampusScoped, db.Model):
+    """A named area of a campus, e.g. the dorms (see zones.py)."""
+
+    __tablename__ = "zone"
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    # [[latitude, longitude], ...], not closed
+    polygon = db.Column(db.JSON, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(
+        db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow
+    )
+
+    __table_args__ = (
+        db.Index("ix_zone_campus_name", "campus_id", "name", unique=True),
+    )
+
+
+class ApiClient(db.Model):
+    """A partner system allowed to push security reports (see ingest.py)."""
+
+    __tablename__ = "api_client"
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), unique=True, nullable=False)
+    # SHA-256 of the bearer token; the token itself is shown once
+    token_hash = db.Column(db.String(64), unique=True, nullable=False)
+    # Not CampusScoped: the client is looked up before the campus is known
+    campus_id = db.Column(db.Integer, default=DEFAULT_CAMPUS_ID, nullable=False)
+    active = db.Column(db.Boolean, default=True, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_used_at = db.Column(db.DateTime)
+
+
+class DeletionJob(db.Model):
+    """Background deletion of a large account, polled by the admin UI."""
+
+    __tablename__ = "deletion_job"
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)  # no FK: the user goes away
+    user_email = db.Column(db.String)
+    # pending, running, done, failed
+    status = db.Column(db.String(20), default="pending")
+    error = db.Column(db.String(500))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+
+class FeedGeneration(db.Model):
+    """Bumped by writes that reshape a campus's recent feed (see recent_feed.py)."""
+
+    __tablename__ = "feed_generation"
+
+    campus_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    generation = db.Column(db.Integer, default=0, nullable=False)
+
+
+class JobWatermark(db.Model):
+    """How far an incremental batch job has read, and the settings it used."""
+
+    __tablename__ = "job_watermark"
+
+    name = db.Column(db.String(50), primary_key=True)
+    last_id = db.Column(db.Integer, default=0, nullable=False)
+    # Ids near last_id already processed, so the tail can be re-read safely
+    recent_ids = db.Column(db.JSON)
+    params = db.Column(db.JSON)
+    updated_at = db.Column(
+        db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow
+    )
+
+
+class HotspotCell(db.Model):
+    """Security reports of one type aggregated on one cell of the hotspot grid."""
+
+    __tablename__ = "hotspot_cell"
+
+    id = db.Column(db.Integer, primary_key=True)
+    campus_id = db.Column(db.Integer, nullable=False)
+    type = db.Column(db.String(50), nullable=False)
+    cell_x = db.Column(db.Integer, nullable=False)
+    cell_y = db.Column(db.Integer, nullable=False)
+    count = db.Column(db.Integer, default=0, nullable=False)
+    sum_lat = db.Column(db.Float, default=0.0, nullable=False)
+    sum_lon = db.Column(db.Float, default=0.0, nullable=False)
+    hours = db.Column(db.JSON)  # 24 counts by local hour of day
+    weeks = db.Column(db.JSON)  # week number -> count, recent weeks only
+
+    __table_args__ = (
+        db.UniqueConstraint(
+            "campus_id", "type", "cell_x", "cell_y", name="unique_hotspot_cell"
+        ),
+    )
+
+
+class Hotspot(db.Model):
+    """A ranked cluster of reports, replaced on every hotspot run."""
+
+    __tablename__ = "hotspot"
+
+    id = db.Column(db.Integer, primary_key=True)
+    campus_id = db.Column(db.Integer, nullable=False)
+    type = db.Column(db.String(50), nullable=False)
+    rank = db.Column(db.Integer, nullable=False)  # 1 = most reports, per type
+    report_count = db.Column(db.Integer, nullable=False)
+    cell_count = db.Column(db.Integer, nullable=False)
+    latitude = db.Column(db.Float, nullable=False)
+    longitude = db.Column(db.Float, nullable=False)
+    radius_m = db.Column(db.Float, nullable=False)
+    hours = db.Column(db.JSON)
+    recent_count = db.Column(db.Integer, default=0)
+    previous_count = db.Column(db.Integer, default=0)
+    trend = db.Column(db.Float)  # recent vs previous window, None if no history
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index("ix_hotspot_campus_type_rank", "campus_id", "type", "rank"),
+    )
+
+
+class IncidentHour(db.Model):
+    """Security reports of one type in one UTC hour, kept up to date on insert."""
+
+    __tablename__ = "incident_hour"
 
+    campus_id = db.Column(db.Integer, primary_key=True)
+    type = db.Column(db.String(50), primary_key=True)
+    hour = db.Column(db.Integer, primary_key=True)  # hours since the Unix epoch
+    count = db.Column(db.Integer, default=0, nullable=False)
@@ -0,0 +1,471 @@
+"""SQL-side read models for the heavier admin and profile endpoints.
+
+These replace "load every row, lazy-load its relationships, aggregate in
+Python" with grouped queries and keyset (cursor) pagination. Cursors are
+opaque to clients: URL-safe base64 of a JSON list of the sort key values.
+"""
+
+import base64
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import g
+from sqlalchemy import case, func, literal, select, union_all, update
+
+from config import db
+from models import (
+    AdminResponse,
+    User,
+    Post,
+    Comment,
+    Reaction,
+    Category,
+    SecurityReport,
+    EscortRequest,
+)
+from uploads import image_urls
+
+
+def encode_cursor(*values):
+    values = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Return the list of values in a cursor; raises ValueError if malformed."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list):
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def keyset_filter(key, id_column, after, descending):
+    """``(key, id)`` strictly after the cursor position in the given order."""
+    value, last_id = after
+    if descending:
+        return db.or_(key < value, db.and_(key == value, id_column < last_id))
+    return db.or_(key > value, db.and_(key == value, id_column > last_id))
+
+
+# --- Admin user directory ---
+
+USER_SORTS = ("activity", "last_seen", "joined", "email")
+
+
+def activity_stats(user_ids=None):
+    """One grouped query: per-user post/comment/reaction counts and last activity."""
+    parts = []
+    for model, kind in ((Post, "post"), (Comment, "comment"), (Reaction, "reaction")):
+        part = select(
+            model.user_id.label("user_id"),
+            literal(kind).label("kind"),
+            model.created_at.label("created_at"),
+        ).where(model.user_id.isnot(None))
+        if user_ids is not None:
+            part = part.where(model.user_id.in_(user_ids))
+        parts.append(part)
+    rows = union_all(*parts).subquery()
+
+    def count_of(kind):
+        return func.sum(case((rows.c.kind == kind, 1), else_=0))
+
+    return (
+        select(
+            rows.c.user_id,
+            count_of("post").label("posts_count"),
+            count_of("comment").label("comments_count"),
+            count_of("reaction").label("reactions_count"),
+            # Last activity is the latest post or comment, as before
+            func.max(case((rows.c.kind != "reaction", rows.c.created_at))).label(
+                "last_activity"
+            ),
+        )
+        .group_by(rows.c.user_id)
+        .subquery()
+    )
+
+
+def user_directory(
+    sort="activity", descending=True, email_prefix=None, after=None, limit=50
+):
+    """Page of users with activity counts. Returns ``(rows, next_cursor)``.
+
+    ``joined`` and ``email`` sorts page over the user table's indexes first
+    and aggregate just that page; ``activity`` and ``last_seen`` need the
+    aggregate for every user and sort on it in one grouped query.
+    """
+    filters = []
+    if email_prefix:
+        # Range instead of LIKE so the unique email index is usable everywhere
+        filters.append(User.email >= email_prefix)
+        filters.append(User.email < email_prefix + "\uffff")
+
+    if sort in ("joined", "email"):
+        key = User.created_at if sort == "joined" else User.email
+        page = select(User.id).where(*filters)
+        if after:
+            if sort == "joined":
+                after = (datetime.fromisoformat(after[0]), after[1])
+            page = page.where(keyset_filter(key, User.id, after, descending))
+        order = (key.desc(), User.id.desc()) if descending else (key, User.id)
+        page_ids = db.session.scalars(page.order_by(*order).limit(limit + 1)).all()
+        stats = activity_stats(page_ids[:limit])
+        filters = [User.id.in_(page_ids)]
+        after = None
+    else:
+        stats = activity_stats()
+
+    posts = func.coalesce(stats.c.posts_count, 0)
+    comments = func.coalesce(stats.c.comments_count, 0)
+    reactions = func.coalesce(stats.c.reactions_count, 0)
+    total = posts + comments + reactions
+    keys = {
+        "activity": total,
+        "last_seen": func.coalesce(stats.c.last_activity, datetime(1970, 1, 1)),
+        "joined": User.created_at,
+        "email": User.email,
+    }
+    key = keys[sort]
+
+    query = (
+        select(
+            User.id,
+            User.email,
+            User.role,
+            User.created_at,
+            posts.label("posts_count"),
+            comments.label("comments_count"),
+            reactions.label("reactions_count"),
+            total.label("total_activity"),
+            stats.c.last_activity,
+            key.label("sort_key"),
+        )
+        .outerjoin(stats, stats.c.user_id == User.id)
+        .where(*filters)
+    )
+    if after:
+        if sort == "last_seen":
+            after = (datetime.fromisoformat(after[0]), after[1])
+        query = query.where(keyset_filter(key, User.id, after, descending))
+    order = (key.desc(), User.id.desc()) if descending else (key, User.id)
+    rows = db.session.execute(query.order_by(*order).limit(limit + 1)).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].sort_key, rows[-1].id)
+    return rows, next_cursor
+
+
+# --- User activity timeline ---
+
+ACTIVITY_SECTIONS = (
+    "posts",
+    "comments",
+    "reactions",
+    "security_reports",
+    "escort_requests",
+)
+
+section_executor = ThreadPoolExecutor(
+    max_workers=len(ACTIVITY_SECTIONS), thread_name_prefix="activity"
+)
+
+
+def preview(content, length=50):
+    return content[:length] + "..." if len(content) > length else content
+
+
+def _before(model, section, before):
+    """Rows of one section strictly older than the merged cursor.
+
+    The merged order is (created_at, section, id) descending, so on a
+    created_at tie a section sorting before the cursor's section is entirely
+    "after" it.
+    """
+    created_at, cursor_section, cursor_id = before
+    if section < cursor_section:
+        return model.created_at <= created_at
+    if section > cursor_section:
+        return model.created_at < created_at
+    return db.or_(
+        model.created_at < created_at,
+        db.and_(model.created_at == created_at, model.id < cursor_id),
+    )
+
+
+def _section_rows(section, user_id, before, limit):
+    if section == "posts":
+        query = (
+            select(
+                Post.id,
+                Post.content,
+                Post.images,
+                Post.created_at,
+                Post.likes_count.label("likes"),
+                Post.dislikes_count.label("dislikes"),
+                Post.comments_count,
+                Category.name.label("category_name"),
+            )
+            .outerjoin(Category, Category.id == Post.category_id)
+            .where(Post.user_id == user_id)
+        )
+        model = Post
+    elif section in ("comments", "reactions"):
+        model = Comment if section == "comments" else Reaction
+        fields = (
+            (Comment.content, Comment.images)
+            if section == "comments"
+            else (Reaction.reaction_type,)
+        )
+        query = (
+            select(
+                model.id,
+                *fields,
+                model.post_id,
+                model.created_at,
+                Post.content.label("post_content"),
+            )
+            .join(Post, Post.id == model.post_id)
+            .where(model.user_id == user_id)
+        )
+    elif section == "security_reports":
+        model = SecurityReport
+        query = select(
+            SecurityReport.id,
+            SecurityReport.type,
+            SecurityReport.description,
+            SecurityReport.latitude,
+            SecurityReport.longitude,
+            SecurityReport.created_at,
+        ).where(SecurityReport.user_id == user_id)
+    else:
+        model = EscortRequest
+        query = select(
+            EscortRequest.id,
+            EscortRequest.message,
+            EscortRequest.latitude,
+            EscortRequest.longitude,
+            EscortRequest.status,
+            EscortRequest.created_at,
+        ).where(EscortRequest.user_id == user_id)
+
+    if before:
+        query = query.where(_before(model, section, before))
+    query = query.order_by(model.created_at.desc(), model.id.desc()).limit(limit)
+
+    items = []
+    for row in db.session.execute(query).mappings():
+        item = dict(row)
+        if "images" in item:
+            item["images"] = image_urls(item["images"])
+        if "post_content" in item:
+            item["post_content"] = preview(item["post_content"])
+        item["type"] = section
+        items.append(item)
+    return items
+
+
+def _section_rows_in_context(app, replica_bind, *args):
+    with app.app_context():
+        g.replica_bind = replica_bind
+        return _section_rows(*args)
+
+
+def user_activity(app, user_id, sections=ACTIVITY_SECTIONS, before=None, limit=20):
+    """Merged, newest-first activity timeline. Returns ``(items, next_cursor)``.
+
+    Each section fetches at most ``limit + 1`` rows older than the cursor,
+    so no section is ever read past what one page could need. The sections
+    run concurrently, each in its own app context and DB session, and the
+    results are merged.
+    """
+    futures = [
+        section_executor.submit(
+            _section_rows_in_context,
+            app,
+            g.get("replica_bind"),
+            section,
+            user_id,
+            before,
+            limit + 1,
+        )
+        for section in sections
+    ]
+    items = [item for future in futures for item in future.result()]
+    items.sort(key=lambda i: (i["created_at"], i["type"], i["id"]), reverse=True)
+
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        last = items[-1]
+        next_cursor = encode_cursor(last["created_at"], last["type"], last["id"])
+    return items, next_cursor
+
+
+# --- Moderation queue ---
+
+MODERATION_SORTS = ("priority", "oldest", "newest")
+
+
+def moderation_queue(sort="priority", after=None, limit=20):
+    """Unanswered posts, most important first. Returns ``(posts, next_cursor)``.
+
+    ``priority`` orders by the hot score (reactions and comments decayed by
+    age); every sort is a range scan of a (moderation_status, key, id) index.
+    """
+    key = Post.hot_score if sort == "priority" else Post.created_at
+    descending = sort != "oldest"
+    query = Post.query.filter(Post.moderation_status == "pending")
+    if after:
+        value, post_id = after
+        if sort != "priority":
+            value = datetime.fromisoformat(value)
+        query = query.filter(keyset_filter(key, Post.id, (value, post_id), descending))
+    order = (key.desc(), Post.id.desc()) if descending else (key, Post.id)
+    posts = query.order_by(*order).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(posts) > limit:
+        posts = posts[:limit]
+        last = posts[-1]
+        next_cursor = encode_cursor(
+            last.hot_score if sort == "priority" else last.created_at, last.id
+        )
+    return posts, next_cursor
+
+
+def restamp_moderation_status():
+    """Rebuild every post's moderation_status from its admin responses."""
+    answered = select(AdminResponse.id).where(AdminResponse.post_id == Post.id)
+    db.session.execute(
+        update(Post)
+        .values(
+            moderation_status=case((answered.exists(), "responded"), else_="pending")
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+
+# --- Streetwise (security/escort) admin lists ---
+
+REPORT_ACTIVE_WINDOW = timedelta(hours=6)
+ESCORT_ACTIVE_WINDOW = timedelta(minutes=30)
+
+
+def zone_filter(model, zone_id):
+    """Criteria restricting ``model`` to one zone (none when zone_id is None)."""
+    return [] if zone_id is None else [model.zone_id == zone_id]
+
+
+def zone_counts(zone_ids, now):
+    """Report and escort-request counts for each zone id and None (no zone)."""
+    week_ago = now - timedelta(days=7)
+    report_active = now - REPORT_ACTIVE_WINDOW
+    keys = ("reports", "reports_week", "active_reports", "escort_requests")
+    counts = {zone_id: dict.fromkeys(keys, 0) for zone_id in [*zone_ids, None]}
+
+    def entry(zone_id):
+        return counts.setdefault(zone_id, dict.fromkeys(keys, 0))
+
+    reports = db.session.execute(
+        select(
+            SecurityReport.zone_id,
+            func.count(SecurityReport.id),
+            func.sum(case((SecurityReport.created_at >= week_ago, 1), else_=0)),
+            func.sum(case((SecurityReport.created_at >= report_active, 1), else_=0)),
+        ).group_by(SecurityReport.zone_id)
+    )
+    for zone_id, total, week, active in reports:
+        entry(zone_id).update(
+            reports=total, reports_week=week or 0, active_reports=active or 0
+        )
+    requests = db.session.execute(
+        select(EscortRequest.zone_id, func.count(EscortRequest.id)).group_by(
+            EscortRequest.zone_id
+        )
+    )
+    for zone_id, total in requests:
+        entry(zone_id)["escort_requests"] = total
+    return counts
+
+
+def streetwise_summary(since, now, zone_id=None):
+    """Active/archived counts for reports and escort requests since ``since``."""
+    report_active = now - REPORT_ACTIVE_WINDOW
+    escort_active = now - ESCORT_ACTIVE_WINDOW
+    reports = db.session.execute(
+        select(
+            func.count(SecurityReport.id),
+            func.coalesce(
+                func.sum(
+                    case((SecurityReport.created_at >= report_active, 1), else_=0)
+                ),
+                0,
+            ),
+        )
+        .where(SecurityReport.created_at >= since)
+        .where(*zone_filter(SecurityReport, zone_id))
+    ).one()
+    requests = db.session.execute(
+        select(
+            func.count(EscortRequest.id),
+            func.coalesce(
+                func.sum(
+                    case(
+                        (
+                            db.and_(
+                                EscortRequest.status == "active",
+                                EscortRequest.created_at >= escort_active,
+                            ),
+                            1,
+                        ),
+                        else_=0,
+                    )
+                ),
+                0,
+            ),
+        )
+        .where(EscortRequest.created_at >= since)
+        .where(*zone_filter(EscortRequest, zone_id))
+    ).one()
+    return {
+        "total_reports": reports[0],
+        "active_reports": reports[1],
+        "archived_reports": reports[0] - reports[1],
+        "total_requests": requests[0],
+        "active_requests": requests[1],
+    }
+
+
+def streetwise_page(model, since, after=None, limit=50, zone_id=None):
+    """Newest-first page of reports or escort requests with the user's email."""
+    query = (
+        select(model, User.email.label("user_email"))
+        .outerjoin(User, User.id == model.user_id)
+        .where(model.created_at >= since, *zone_filter(model, zone_id))
+    )
+    if after:
+        value, row_id = after
+        query = query.where(
+            keyset_filter(
+                model.created_at,
+                model.id,
+                (datetime.fromisoformat(value), row_id),
+                descending=True,
+            )
+        )
+    query = query.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1)
+    rows = db.session.execute(query).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1][0]
+        next_cursor = encode_cursor(last.created_at, last.id)
+    return rows, next_cursor
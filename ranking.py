@@ -0,0 +1,147 @@
+"""Time-decayed "hot" score for the feed.
+
+hot = (likes - DISLIKE_WEIGHT * dislikes + COMMENT_WEIGHT * comments + 1)
+      / (age_hours + 2) ** HOT_GRAVITY
+
+The score is stored on ``Post.hot_score`` (indexed) and refreshed for one
+post whenever a reaction or comment changes its counters. Because age keeps
+growing, a periodic job re-decays the scores of recent posts in bulk.
+"""
+
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select, update
+
+from config import db
+from models import Post, Reaction, Comment
+
+HOT_GRAVITY = float(os.getenv("HOT_GRAVITY", "1.5"))
+DISLIKE_WEIGHT = 0.5
+COMMENT_WEIGHT = 2.0
+# Posts older than this have decayed to (almost) nothing and are pinned to 0
+HOT_WINDOW = timedelta(days=int(os.getenv("HOT_WINDOW_DAYS", "14")))
+HOT_RESCORE_INTERVAL = int(os.getenv("HOT_RESCORE_INTERVAL", "300"))  # seconds
+
+
+def hot_score(likes, dislikes, comments, created_at, now=None):
+    now = now or datetime.utcnow()
+    age_hours = max((now - created_at).total_seconds() / 3600, 0.0)
+    engagement = likes - DISLIKE_WEIGHT * dislikes + COMMENT_WEIGHT * comments
+    return (engagement + 1) / (age_hours + 2) ** HOT_GRAVITY
+
+
+def refresh_hot_score(post_id):
+    """Recompute one post's score from its stored counters."""
+    row = (
+        db.session.query(
+            Post.likes_count, Post.dislikes_count, Post.comments_count, Post.created_at
+        )
+        .filter(Post.id == post_id)
+        .first()
+    )
+    if row is None:
+        return
+    db.session.execute(
+        update(Post).where(Post.id == post_id).values(hot_score=hot_score(*row))
+    )
+
+
+def record_reaction(post_id, old_type, new_type):
+    """Move the post's like/dislike counters from old_type to new_type."""
+    if old_type == new_type:
+        return
+    values = {}
+    for reaction_type, delta in ((old_type, -1), (new_type, 1)):
+        if reaction_type == "like":
+            values["likes_count"] = Post.likes_count + delta
+        elif reaction_type == "dislike":
+            values["dislikes_count"] = Post.dislikes_count + delta
+    if values:
+        db.session.execute(update(Post).where(Post.id == post_id).values(**values))
+    refresh_hot_score(post_id)
+
+
+def record_comment(post_id, delta):
+    db.session.execute(
+        update(Post)
+        .where(Post.id == post_id)
+        .values(comments_count=Post.comments_count + delta)
+    )
+    refresh_hot_score(post_id)
+
+
+def recount_posts(post_ids=None):
+    """Rebuild post counters (all posts, or just post_ids) from the source tables."""
+
+    def reaction_count(reaction_type):
+        return (
+            select(func.count(Reaction.id))
+            .where(Reaction.post_id == Post.id, Reaction.reaction_type == reaction_type)
+            .scalar_subquery()
+        )
+
+    stmt = update(Post).values(
+        likes_count=reaction_count("like"),
+        dislikes_count=reaction_count("dislike"),
+        comments_count=select(func.count(Comment.id))
+        .where(Comment.post_id == Post.id)
+        .scalar_subquery(),
+    )
+    if post_ids is not None:
+        stmt = stmt.where(Post.id.in_(post_ids))
+    db.session.execute(stmt.execution_options(synchronize_session=False))
+    db.session.commit()
+    rescore_hot_posts(post_ids)
+
+
+def rescore_hot_posts(post_ids=None, batch_size=500):
+    """Re-decay the scores of posts inside the hot window in bulk."""
+    now = datetime.utcnow()
+    cutoff = now - HOT_WINDOW
+    query = select(
+        Post.id,
+        Post.likes_count,
+        Post.dislikes_count,
+        Post.comments_count,
+        Post.created_at,
+    ).where(Post.created_at >= cutoff)
+    if post_ids is not None:
+        query = query.where(Post.id.in_(post_ids))
+    rows = db.session.execute(query).all()
+    for start in range(0, len(rows), batch_size):
+        db.session.execute(
+            update(Post),
+            [
+                {"id": post_id, "hot_score": hot_score(*counters, now=now)}
+                for post_id, *counters in rows[start : start + batch_size]
+            ],
+        )
+    db.session.execute(
+        update(Post)
+        .where(Post.created_at < cutoff, Post.hot_score != 0)
+        .values(hot_score=0)
+    )
+    db.session.commit()
+    return len(rows)
+
+
+def start_hot_rescorer(app):
+    """Re-decay hot scores every HOT_RESCORE_INTERVAL seconds on a daemon thread."""
+    if HOT_RESCORE_INTERVAL <= 0:
+        return None
+
+    def run():
+        while True:
+            time.sleep(HOT_RESCORE_INTERVAL)
+            try:
+                with app.app_context():
+                    rescore_hot_posts()
+            except Exception as e:
+                app.logger.error("Hot score rescore failed: %s", e)
+
+    thread = threading.Thread(target=run, name="hot-rescorer", daemon=True)
+    thread.start()
+    return thread
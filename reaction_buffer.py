@@ -0,0 +1,286 @@
+"""Write-behind buffer for reaction toggles (REACTION_WRITE_BEHIND=1).
+
+When enabled, ``add_reaction`` applies the toggle to in-memory state and
+answers straight away with the projected counts. A flusher thread writes the
+accumulated changes every REACTION_FLUSH_MS milliseconds: one batch of
+upserts/deletes on ``reaction``, one counter update per touched post and a
+single commit, instead of a transaction per click.
+
+Durability bound: at most one flush interval of toggles, and never more than
+REACTION_MAX_PENDING pending keys, is lost if the process dies. Past that
+limit the request that fills the buffer flushes it inline. The buffer is
+also flushed at interpreter exit.
+
+Projected counts are per process: with several workers, each one's answers
+include only its own pending toggles until they reach the database.
+"""
+
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import delete, insert, select, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from config import db
+from models import Post, Reaction, User
+import ranking
+import recent_feed
+import tenancy
+
+REACTION_WRITE_BEHIND = os.getenv("REACTION_WRITE_BEHIND", "0") == "1"
+REACTION_FLUSH_MS = int(os.getenv("REACTION_FLUSH_MS", "250"))
+REACTION_MAX_PENDING = int(os.getenv("REACTION_MAX_PENDING", "2000"))
+
+COUNTERS = {"like": 0, "dislike": 1}
+UPSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+CHUNK_SIZE = 500
+
+logger = logging.getLogger(__name__)
+
+
+class ReactionBuffer:
+    def __init__(self, max_pending):
+        self.max_pending = max_pending
+        # (post_id, user_id) -> [stored reaction, reaction after the toggles]
+        self.pending = {}
+        self.inflight = {}
+        # post_id -> [likes, dislikes, campus_id], counts including pending toggles
+        self.counts = {}
+        self.generation = 0
+        self.flushes = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def toggle(self, post_id, user_id, reaction_type):
+        """Apply one toggle; returns the response body, or None for a missing post."""
+        key = (post_id, user_id)
+        campus_id = tenancy.current_campus_id()
+        while True:
+            with self._lock:
+                generation = self.generation
+                known = key in self.pending or key in self.inflight
+                have_counts = post_id in self.counts
+            stored = counts = None
+            if not known:
+                stored = (
+                    db.session.query(Reaction.reaction_type)
+                    .filter_by(post_id=post_id, user_id=user_id)
+                    .scalar()
+                )
+            if not have_counts:
+                counts = (
+                    db.session.query(
+                        Post.likes_count, Post.dislikes_count, Post.campus_id
+                    )
+                    .filter(Post.id == post_id)
+                    .first()
+                )
+                if counts is None:
+                    return None
+            with self._lock:
+                # A flush landed between the reads and now; they may be stale
+                if self.generation != generation:
+                    continue
+                post_counts = self.counts.setdefault(post_id, list(counts or ()))
+                # Cached by a request from another campus; the post is not visible
+                if campus_id is not None and post_counts[2] != campus_id:
+                    return None
+                entry = self.pending.get(key)
+                if entry is None:
+                    inflight = self.inflight.get(key)
+                    current = inflight[1] if inflight else stored
+                    entry = self.pending[key] = [current, current]
+                old_type = entry[1]
+                new_type = None if old_type == reaction_type else reaction_type
+                entry[1] = new_type
+                for t, step in ((old_type, -1), (new_type, 1)):
+                    if t in COUNTERS:
+                        post_counts[COUNTERS[t]] += step
+                result = {
+                    "likes": post_counts[0],
+                    "dislikes": post_counts[1],
+                    "user_reaction": new_type,
+                }
+                full = len(self.pending) >= self.max_pending
+            break
+        if full:
+            # The toggle is already applied; a failed batch stays pending
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error("Inline reaction flush failed: %s", e)
+        return result
+
+    def user_reactions(self, user_id, post_ids, reactions):
+        """Overlay the user's unflushed toggles on a post id -> reaction map."""
+        with self._lock:
+            for post_id in post_ids:
+                entry = self.pending.get((post_id, user_id)) or self.inflight.get(
+                    (post_id, user_id)
+                )
+                if entry is None:
+                    continue
+                if entry[1] is None:
+                    reactions.pop(post_id, None)
+                else:
+                    reactions[post_id] = entry[1]
+        return reactions
+
+    def flush(self):
+        """Write pending toggles in one transaction; returns the rows changed."""
+        with self._flush_lock:
+            with self._lock:
+                if not self.pending:
+                    return 0
+                batch, self.pending = self.pending, {}
+                self.inflight = batch
+            try:
+                # Pending toggles span campuses, whichever request flushes them
+                with tenancy.unscoped():
+                    written = self._write(batch)
+            except Exception:
+                db.session.rollback()
+                with self._lock:
+                    # Keep the stored side of the failed batch, the newest result
+                    for key, (stored, new_type) in batch.items():
+                        if key in self.pending:
+                            self.pending[key][0] = stored
+                        else:
+                            self.pending[key] = [stored, new_type]
+                    self.inflight = {}
+                    self.failures += 1
+                raise
+            with self._lock:
+                self.inflight = {}
+                self.generation += 1
+                self.flushes += 1
+                touched = {post_id for post_id, _ in self.pending}
+                for post_id in list(self.counts):
+                    if post_id not in touched:
+                        del self.counts[post_id]
+            return written
+
+    def _write(self, batch):
+        changes = {key: entry for key, entry in batch.items() if entry[0] != entry[1]}
+        if not changes:
+            return 0
+        # Posts or users deleted since the toggle drop their reactions
+        # post id -> campus id
+        live_posts = dict(
+            db.session.execute(
+                select(Post.id, Post.campus_id).where(
+                    Post.id.in_({p for p, _ in changes})
+                )
+            ).all()
+        )
+        live_users = set(
+            db.session.scalars(
+                select(User.id).where(User.id.in_({u for _, u in changes}))
+            )
+        )
+        now = datetime.utcnow()
+        upserts, removals, deltas = [], [], {}
+        for (post_id, user_id), (stored, new_type) in changes.items():
+            if post_id not in live_posts or user_id not in live_users:
+                continue
+            if new_type is None:
+                removals.append((post_id, user_id))
+            else:
+                upserts.append(
+                    {
+                        "post_id": post_id,
+                        "user_id": user_id,
+                        "reaction_type": new_type,
+                        "created_at": now,
+                    }
+                )
+            post_deltas = deltas.setdefault(post_id, [0, 0])
+            for t, step in ((stored, -1), (new_type, 1)):
+                if t in COUNTERS:
+                    post_deltas[COUNTERS[t]] += step
+
+        _delete_keys(removals)
+        if upserts:
+            upsert = UPSERTS.get(db.session.get_bind().dialect.name)
+            if upsert:
+                stmt = upsert(Reaction)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[Reaction.user_id, Reaction.post_id],
+                    set_={"reaction_type": stmt.excluded.reaction_type},
+                )
+            else:
+                _delete_keys([(row["post_id"], row["user_id"]) for row in upserts])
+                stmt = insert(Reaction)
+            db.session.execute(stmt, upserts)
+        feed_posts = defaultdict(list)
+        for post_id, (likes, dislikes) in deltas.items():
+            if likes or dislikes:
+                db.session.execute(
+                    update(Post)
+                    .where(Post.id == post_id)
+                    .values(
+                        likes_count=Post.likes_count + likes,
+                        dislikes_count=Post.dislikes_count + dislikes,
+                    )
+                )
+                ranking.refresh_hot_score(post_id)
+                feed_posts[live_posts[post_id]].append(post_id)
+        for campus_id, post_ids in feed_posts.items():
+            recent_feed.counts_changed(campus_id, post_ids)
+        db.session.commit()
+        return len(upserts) + len(removals)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pending": len(self.pending),
+                "inflight": len(self.inflight),
+                "posts": len(self.counts),
+                "flushes": self.flushes,
+                "failures": self.failures,
+            }
+
+
+def _delete_keys(keys):
+    for start in range(0, len(keys), CHUNK_SIZE):
+        db.session.execute(
+            delete(Reaction)
+            .where(
+                tuple_(Reaction.post_id, Reaction.user_id).in_(
+                    keys[start : start + CHUNK_SIZE]
+                )
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+
+buffer = ReactionBuffer(REACTION_MAX_PENDING)
+
+
+def start_reaction_flusher(app):
+    """Flush the buffer every REACTION_FLUSH_MS on a daemon thread, and at exit."""
+    if not REACTION_WRITE_BEHIND:
+        return None
+
+    def flush():
+        try:
+            with app.app_context():
+                buffer.flush()
+        except Exception as e:
+            app.logger.error("Reaction flush failed: %s", e)
+
+    def run():
+        while True:
+            time.sleep(REACTION_FLUSH_MS / 1000)
+            flush()
+
+    atexit.register(flush)
+    thread = threading.Thread(target=run, name="reaction-flusher", daemon=True)
+    thread.start()
+    return thread
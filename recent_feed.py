@@ -0,0 +1,432 @@
+"""Process-local ring buffer of each campus's newest posts.
+
+``get_posts`` without ``sort=hot`` is the first page of a campus's feed:
+its 10 newest posts, or the 10 newest of one category. Each worker keeps
+the RECENT_FEED_SIZE newest posts of a campus, overall and per category, as
+compact records with their counters and admin response, and answers those
+requests from memory. Only the caller's own reactions still come from the
+database.
+
+Writes that change which posts the feed shows, or their admin response
+or category name, call one of the functions below inside their
+transaction. That bumps the campus's row in ``feed_generation``; after the
+commit the worker that made the write applies it to its own copy. Other
+workers compare their copy's generation with the database at most every
+RECENT_FEED_CHECK_MS (on every request for clients pinned to the primary
+after a write, see replicas.py) and reload the campus when it has moved. A
+copy that misses a change it cannot apply is dropped and reloaded.
+
+Reactions and comments don't bump the generation, so they never wait on
+that row's lock. The worker that made them refreshes its copy's counters
+on the next read; other workers refresh theirs at each check, so counters
+there lag by at most RECENT_FEED_CHECK_MS.
+"""
+
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from itertools import islice
+
+from flask import session
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from config import db
+from models import AdminResponse, Category, FeedGeneration, Post, UniversitySettings
+from replicas import RoutingSession
+import tenancy
+import uploads
+
+RECENT_FEED = os.getenv("RECENT_FEED", "1") == "1"
+RECENT_FEED_SIZE = int(os.getenv("RECENT_FEED_SIZE", "50"))
+RECENT_FEED_CHECK_MS = int(os.getenv("RECENT_FEED_CHECK_MS", "1000"))
+PAGE_SIZE = 10
+# Reads retried while writes keep moving the generation under them
+LOAD_ATTEMPTS = 3
+# Ring of every category's posts
+ALL = "all"
+UPSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+
+class FeedPost:
+    __slots__ = (
+        "id",
+        "content",
+        "images",
+        "category_id",
+        "user_id",
+        "created_at",
+        "likes",
+        "dislikes",
+        "comments",
+        "admin_response",
+    )
+
+    def __init__(
+        self,
+        id,
+        content,
+        images,
+        category_id,
+        user_id,
+        created_at,
+        likes=0,
+        dislikes=0,
+        comments=0,
+        admin_response=None,
+    ):
+        self.id = id
+        self.content = content
+        self.images = uploads.image_urls(images)
+        self.category_id = category_id
+        self.user_id = user_id
+        self.created_at = created_at
+        self.likes = likes
+        self.dislikes = dislikes
+        self.comments = comments
+        self.admin_response = admin_response
+
+    @property
+    def sort_key(self):
+        return self.created_at, self.id
+
+
+class CampusFeed:
+    def __init__(self, generation, category_names):
+        self.generation = generation
+        self.checked_at = time.monotonic()
+        # This worker changed counters of posts in the feed
+        self.counts_stale = False
+        self.category_names = category_names
+        self.records = {}
+        # ALL or category id -> deque of post ids, newest first
+        self.rings = {}
+        # Rings holding every post of their key, not just the newest
+        self.complete = set()
+
+    def load(self, key, records):
+        self.rings[key] = deque(
+            (r.id for r in records[:RECENT_FEED_SIZE]), maxlen=RECENT_FEED_SIZE
+        )
+        if len(records) < RECENT_FEED_SIZE:
+            self.complete.add(key)
+        for record in records:
+            self.records.setdefault(record.id, record)
+
+    def keys(self, record):
+        return (ALL,) if record.category_id is None else (ALL, record.category_id)
+
+    def add(self, record):
+        self.records[record.id] = record
+        for key in self.keys(record):
+            ring = self.rings.get(key)
+            if ring is None:
+                # A category without posts until now
+                self.rings[key] = deque([record.id], maxlen=RECENT_FEED_SIZE)
+                self.complete.add(key)
+                continue
+            position = len(ring)
+            for i, post_id in enumerate(ring):
+                if self.records[post_id].sort_key < record.sort_key:
+                    position = i
+                    break
+            if len(ring) == RECENT_FEED_SIZE:
+                if position == len(ring):
+                    continue
+                self.complete.discard(key)
+                self._release(ring.pop())
+            ring.insert(position, record.id)
+        self._release(record.id)
+
+    def _release(self, post_id):
+        """Forget a record once no ring refers to it."""
+        record = self.records[post_id]
+        if not any(post_id in self.rings.get(k, ()) for k in self.keys(record)):
+            del self.records[post_id]
+
+    def remove(self, post_ids):
+        """Drop posts; False if a ring can no longer fill a page."""
+        usable = True
+        for post_id in post_ids:
+            record = self.records.pop(post_id, None)
+            if record is None:
+                continue
+            for key in self.keys(record):
+                ring = self.rings.get(key)
+                if ring is not None and post_id in ring:
+                    ring.remove(post_id)
+                    if len(ring) < PAGE_SIZE and key not in self.complete:
+                        usable = False
+        return usable
+
+
+feeds = {}
+_lock = threading.Lock()
+# One reload at a time; requests arriving meanwhile wait and share it
+_load_lock = threading.Lock()
+
+
+def _generation(campus_id):
+    generation = db.session.scalar(
+        select(FeedGeneration.generation).where(FeedGeneration.campus_id == campus_id)
+    )
+    return generation or 0
+
+
+def _bump(campus_id):
+    """Advance the campus's generation in this transaction; returns it."""
+    upsert = UPSERTS.get(db.session.get_bind().dialect.name)
+    if upsert is None:
+        # Without RETURNING the new value is unknown; this worker reloads
+        result = db.session.execute(
+            update(FeedGeneration)
+            .where(FeedGeneration.campus_id == campus_id)
+            .values(generation=FeedGeneration.generation + 1)
+        )
+        if not result.rowcount:
+            db.session.execute(
+                insert(FeedGeneration).values(campus_id=campus_id, generation=1)
+            )
+        return None
+    stmt = upsert(FeedGeneration).values(campus_id=campus_id, generation=1)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[FeedGeneration.campus_id],
+        set_={"generation": FeedGeneration.generation + 1},
+    )
+    return db.session.execute(stmt.returning(FeedGeneration.generation)).scalar()
+
+
+def _refresh_counts(feed):
+    feed.counts_stale = False
+    rows = db.session.execute(
+        select(
+            Post.id, Post.likes_count, Post.dislikes_count, Post.comments_count
+        ).where(Post.id.in_(list(feed.records)))
+    ).all()
+    with _lock:
+        for post_id, likes, dislikes, comments in rows:
+            record = feed.records.get(post_id)
+            if record is not None:
+                record.likes = likes
+                record.dislikes = dislikes
+                record.comments = comments
+
+
+def _records(campus_id, category_id=None):
+    query = (
+        select(
+            Post.id,
+            Post.content,
+            Post.images,
+            Post.category_id,
+            Post.user_id,
+            Post.created_at,
+            Post.likes_count,
+            Post.dislikes_count,
+            Post.comments_count,
+        )
+        .where(Post.campus_id == campus_id)
+        .order_by(Post.created_at.desc(), Post.id.desc())
+        .limit(RECENT_FEED_SIZE)
+    )
+    if category_id is not None:
+        query = query.where(Post.category_id == category_id)
+    return [FeedPost(*row) for row in db.session.execute(query)]
+
+
+def load(campus_id):
+    """Read the campus's newest posts; None if writes kept racing the read."""
+    with tenancy.unscoped():
+        for _ in range(LOAD_ATTEMPTS):
+            generation = _generation(campus_id)
+            names = dict(
+                db.session.execute(
+                    select(Category.id, Category.name).where(
+                        Category.campus_id == campus_id
+                    )
+                ).all()
+            )
+            feed = CampusFeed(generation, names)
+            feed.load(ALL, _records(campus_id))
+            for category_id in names:
+                feed.load(category_id, _records(campus_id, category_id))
+            for post_id, content in db.session.execute(
+                select(AdminResponse.post_id, AdminResponse.content)
+                .where(AdminResponse.post_id.in_(list(feed.records)))
+                .order_by(AdminResponse.id.desc())
+            ):
+                feed.records[post_id].admin_response = content
+            # Unchanged generation: no write committed while we were reading
+            if _generation(campus_id) == generation:
+                return feed
+    return None
+
+
+def warm():
+    """Load every campus's feed; run at startup."""
+    if not RECENT_FEED:
+        return 0
+    with tenancy.unscoped():
+        campus_ids = db.session.scalars(select(UniversitySettings.id)).all()
+    for campus_id in campus_ids:
+        feed = load(campus_id)
+        if feed is not None:
+            with _lock:
+                feeds[campus_id] = feed
+    return len(feeds)
+
+
+def _current(campus_id):
+    feed = feeds.get(campus_id)
+    now = time.monotonic()
+    pinned = session.get("primary_until", 0) >= time.time()
+    if (
+        feed is not None
+        and not pinned
+        and not feed.counts_stale
+        and now - feed.checked_at < RECENT_FEED_CHECK_MS / 1000
+    ):
+        return feed
+    with tenancy.unscoped():
+        generation = _generation(campus_id)
+    with _load_lock:
+        feed = feeds.get(campus_id)
+        # A replica may lag behind what this worker has applied
+        if feed is not None and feed.generation >= generation:
+            with tenancy.unscoped():
+                _refresh_counts(feed)
+            feed.checked_at = now
+            return feed
+        feed = load(campus_id)
+        with _lock:
+            if feed is None:
+                feeds.pop(campus_id, None)
+            else:
+                feeds[campus_id] = feed
+    return feed
+
+
+def first_page(campus_id, category_id=None):
+    """(records, category names) of the feed's first page, or None."""
+    if not RECENT_FEED:
+        return None
+    feed = _current(campus_id)
+    if feed is None:
+        return None
+    with _lock:
+        ring = feed.rings.get(category_id or ALL, ())
+        records = [feed.records[post_id] for post_id in islice(ring, PAGE_SIZE)]
+        return records, dict(feed.category_names)
+
+
+def _record(campus_id, change, bump=True):
+    """Apply ``change`` here after commit, bumping the generation if asked."""
+    if not RECENT_FEED:
+        return
+    generation = _bump(campus_id) if bump else False
+    db.session.info.setdefault("recent_feed", []).append(
+        (campus_id, generation, change)
+    )
+
+
+def _apply(campus_id, generation, change):
+    with _lock:
+        feed = feeds.get(campus_id)
+        if feed is None:
+            return
+        if generation is False:
+            # Not sequenced by the generation
+            change(feed)
+            return
+        if generation is not None and feed.generation >= generation:
+            # Loaded after the commit, so already included
+            return
+        if (
+            generation is None
+            or feed.generation != generation - 1
+            or change is None
+            or change(feed) is False
+        ):
+            del feeds[campus_id]
+            return
+        feed.generation = generation
+
+
+def _after_commit(session):
+    for campus_id, generation, change in session.info.pop("recent_feed", ()):
+        _apply(campus_id, generation, change)
+
+
+def _after_transaction_end(session, transaction):
+    if transaction.parent is None:
+        # Rolled back, or already applied by _after_commit
+        session.info.pop("recent_feed", None)
+
+
+def post_created(post):
+    """Record a new, flushed post."""
+    record = FeedPost(
+        post.id,
+        post.content,
+        post.images,
+        post.category_id,
+        post.user_id,
+        post.created_at,
+    )
+
+    def change(feed):
+        if record.category_id is not None:
+            if record.category_id not in feed.category_names:
+                return False
+        feed.add(record)
+
+    _record(post.campus_id, change)
+
+
+def posts_deleted(post_ids):
+    with tenancy.unscoped():
+        rows = db.session.execute(
+            select(Post.campus_id, Post.id).where(Post.id.in_(post_ids))
+        ).all()
+    by_campus = defaultdict(list)
+    for campus_id, post_id in rows:
+        by_campus[campus_id].append(post_id)
+    for campus_id, ids in by_campus.items():
+        _record(campus_id, lambda feed, ids=ids: feed.remove(ids))
+
+
+def counts_changed(campus_id, post_ids):
+    """Record reaction or comment counter changes; no generation bump."""
+
+    def change(feed):
+        if any(post_id in feed.records for post_id in post_ids):
+            feed.counts_stale = True
+
+    _record(campus_id, change, bump=False)
+
+
+def responded(campus_id, post_id, content):
+    def change(feed):
+        record = feed.records.get(post_id)
+        if record is not None and record.admin_response is None:
+            record.admin_response = content
+
+    _record(campus_id, change)
+
+
+def category_renamed(campus_id, category_id, name):
+    def change(feed):
+        feed.category_names[category_id] = name
+
+    _record(campus_id, change)
+
+
+def changed(campus_id):
+    """Record a change this worker can't apply; its copy is reloaded."""
+    _record(campus_id, None)
+
+
+def init_recent_feed():
+    event.listen(RoutingSession, "after_commit", _after_commit)
+    event.listen(RoutingSession, "after_transaction_end", _after_transaction_end)
@@ -0,0 +1,124 @@
+"""Read-replica routing for read-only endpoints.
+
+Replicas are listed in DATABASE_REPLICA_URIS (comma-separated) and become
+Flask-SQLAlchemy binds ``replica_0``, ``replica_1``... sharing the primary's
+engine options. Views decorated with ``@read_only`` pick one healthy
+replica per request (round-robin) and the session sends their SELECTs
+there; flushes and DML always go to the primary. A background thread
+probes each replica with ``SELECT 1`` and takes failing ones out of the
+rotation until they answer again.
+
+After a client writes, its session is pinned to the primary for
+REPLICA_STICKY_SECONDS so it reads its own writes despite replication lag.
+
+Locally, two SQLite files work: copy app.db to replica.db and set
+DATABASE_REPLICA_URIS=sqlite:///replica.db.
+"""
+
+import itertools
+import os
+import threading
+import time
+from functools import wraps
+
+from flask import g, has_app_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import text
+
+REPLICA_URIS = [
+    uri.strip()
+    for uri in os.getenv("DATABASE_REPLICA_URIS", "").split(",")
+    if uri.strip()
+]
+REPLICA_HEALTH_INTERVAL = int(os.getenv("REPLICA_HEALTH_INTERVAL", "10"))
+REPLICA_STICKY_SECONDS = int(os.getenv("REPLICA_STICKY_SECONDS", "5"))
+
+
+class ReplicaRouter:
+    def __init__(self, bind_keys):
+        self.bind_keys = bind_keys
+        self.healthy = set(bind_keys)
+        self._cycle = itertools.cycle(bind_keys)
+        self._lock = threading.Lock()
+
+    def pick(self):
+        """Next healthy replica bind key, or None to use the primary."""
+        with self._lock:
+            for _ in range(len(self.bind_keys)):
+                key = next(self._cycle)
+                if key in self.healthy:
+                    return key
+        return None
+
+    def check(self, engines):
+        for key in self.bind_keys:
+            try:
+                with engines[key].connect() as conn:
+                    conn.execute(text("SELECT 1"))
+                self.healthy.add(key)
+            except Exception:
+                self.healthy.discard(key)
+
+
+router = ReplicaRouter([f"replica_{i}" for i in range(len(REPLICA_URIS))])
+
+
+class RoutingSession(Session):
+    """Session that sends reads to the replica chosen for the request."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (
+            bind is None
+            and not self._flushing
+            and not getattr(clause, "is_dml", False)
+            and has_app_context()
+            and g.get("replica_bind")
+        ):
+            return self._db.engines[g.replica_bind]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def configure(app):
+    """Register replica binds in the app config (before ``db.init_app``)."""
+    binds = app.config.setdefault("SQLALCHEMY_BINDS", {})
+    for key, uri in zip(router.bind_keys, REPLICA_URIS):
+        binds[key] = uri
+
+
+def init_replicas(app, db):
+    if not router.bind_keys:
+        return
+
+    @app.after_request
+    def pin_writers_to_primary(response):
+        if (
+            request.method not in ("GET", "HEAD", "OPTIONS")
+            and response.status_code < 400
+        ):
+            session["primary_until"] = time.time() + REPLICA_STICKY_SECONDS
+        return response
+
+    def run():
+        while True:
+            with app.app_context():
+                router.check(db.engines)
+            time.sleep(REPLICA_HEALTH_INTERVAL)
+
+    threading.Thread(target=run, name="replica-health", daemon=True).start()
+
+
+def read_only(f):
+    """Serve the view's reads from a replica unless the client just wrote."""
+
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        previous = g.get("replica_bind")
+        if router.bind_keys and session.get("primary_until", 0) < time.time():
+            g.replica_bind = router.pick()
+        try:
+            return f(*args, **kwargs)
+        finally:
+            # Batched sub-requests share the app context; don't leak the choice
+            g.replica_bind = previous
+
+    return wrapper
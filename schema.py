@@ -0,0 +1,60 @@
+"""Additive schema upgrades for existing databases.
+
+``db.create_all()`` only creates missing tables, so columns and indexes
+added to existing models would never reach a deployed database. This adds
+whatever is missing (never drops or alters anything) and reports what was
+added so callers can backfill.
+"""
+
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateColumn
+
+from config import db
+
+
+def upgrade_schema():
+    """Add missing columns and indexes. Returns a set of ``"table.column"``."""
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    preparer = db.engine.dialect.identifier_preparer
+    added = set()
+
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        columns = {c["name"] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in columns:
+                continue
+            ddl = "ALTER TABLE {} ADD COLUMN {}".format(
+                preparer.format_table(table),
+                CreateColumn(column).compile(dialect=db.engine.dialect),
+            )
+            with db.engine.begin() as conn:
+                conn.execute(text(ddl))
+            added.add(f"{table.name}.{column.name}")
+
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+
+    return added
+
+
+def drop_outdated_rollups(table_names):
+    """Drop derived tables whose columns no longer match their model.
+
+    Rollups can't be altered in place when their key changes; dropping them
+    lets ``db.create_all()`` recreate them and their jobs refill them.
+    """
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    dropped = []
+    for name in table_names:
+        if name not in existing_tables:
+            continue
+        table = db.metadata.tables[name]
+        columns = {c["name"] for c in inspector.get_columns(name)}
+        if columns != {c.name for c in table.columns}:
+            table.drop(db.engine)
+            dropped.append(name)
+    return dropped
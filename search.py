@@ -0,0 +1,209 @@
+"""Full-text index over post and comment content.
+
+SQLite uses an FTS5 virtual table; Postgres uses a plain table with a
+tsvector column behind a GIN index. Rows are keyed by ``doc_id`` so both
+posts and comments live in one index: ``id * 2`` for posts and
+``id * 2 + 1`` for comments. The create/delete endpoints keep the index in
+sync inside their own transaction.
+"""
+
+import re
+
+from sqlalchemy import text
+
+from config import db
+from models import Post, Comment
+import tenancy
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def post_doc_id(post_id):
+    return post_id * 2
+
+
+def comment_doc_id(comment_id):
+    return comment_id * 2 + 1
+
+
+def dialect():
+    return db.engine.dialect.name
+
+
+def is_supported():
+    return dialect() in ("sqlite", "postgresql")
+
+
+def init_search_index(rebuild=False):
+    """Create the index if needed and backfill it from existing rows."""
+    if dialect() == "sqlite":
+        db.session.execute(
+            text(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+                "kind UNINDEXED, ref_id UNINDEXED, post_id UNINDEXED, "
+                "category_id UNINDEXED, content, tokenize='unicode61')"
+            )
+        )
+    elif dialect() == "postgresql":
+        db.session.execute(
+            text(
+                "CREATE TABLE IF NOT EXISTS search_index ("
+                "doc_id BIGINT PRIMARY KEY, kind VARCHAR(10) NOT NULL, "
+                "ref_id INTEGER NOT NULL, post_id INTEGER NOT NULL, "
+                "category_id INTEGER, content TEXT NOT NULL, "
+                "tsv tsvector GENERATED ALWAYS AS "
+                "(to_tsvector('english', content)) STORED)"
+            )
+        )
+        db.session.execute(
+            text(
+                "CREATE INDEX IF NOT EXISTS ix_search_index_tsv "
+                "ON search_index USING GIN (tsv)"
+            )
+        )
+    else:
+        return
+
+    if rebuild:
+        db.session.execute(text("DELETE FROM search_index"))
+    empty = db.session.execute(text("SELECT 1 FROM search_index LIMIT 1")).first()
+    if empty is None:
+        for post in Post.query.yield_per(500):
+            index_post(post)
+        rows = (
+            db.session.query(Comment, Post.category_id)
+            .join(Post, Comment.post_id == Post.id)
+            .yield_per(500)
+        )
+        for comment, category_id in rows:
+            index_comment(comment, category_id)
+    db.session.commit()
+
+
+def _insert(doc_id, kind, ref_id, post_id, category_id, content):
+    if dialect() == "sqlite":
+        sql = (
+            "INSERT INTO search_index "
+            "(rowid, kind, ref_id, post_id, category_id, content) "
+            "VALUES (:doc_id, :kind, :ref_id, :post_id, :category_id, :content)"
+        )
+    else:
+        sql = (
+            "INSERT INTO search_index "
+            "(doc_id, kind, ref_id, post_id, category_id, content) "
+            "VALUES (:doc_id, :kind, :ref_id, :post_id, :category_id, :content)"
+        )
+    db.session.execute(
+        text(sql),
+        {
+            "doc_id": doc_id,
+            "kind": kind,
+            "ref_id": ref_id,
+            "post_id": post_id,
+            "category_id": category_id,
+            "content": content,
+        },
+    )
+
+
+def index_post(post):
+    """Add a post to the index. The post must already have an id (flush first)."""
+    if not is_supported():
+        return
+    _insert(
+        post_doc_id(post.id), "post", post.id, post.id, post.category_id, post.content
+    )
+
+
+def index_comment(comment, category_id):
+    if not is_supported():
+        return
+    _insert(
+        comment_doc_id(comment.id),
+        "comment",
+        comment.id,
+        comment.post_id,
+        category_id,
+        comment.content,
+    )
+
+
+def unindex(post_ids=(), comment_ids=()):
+    """Remove posts and comments from the index by primary key."""
+    if not is_supported():
+        return
+    doc_ids = [post_doc_id(i) for i in post_ids] + [
+        comment_doc_id(i) for i in comment_ids
+    ]
+    key = "rowid" if dialect() == "sqlite" else "doc_id"
+    for start in range(0, len(doc_ids), 500):
+        batch = doc_ids[start : start + 500]
+        params = {f"d{i}": doc_id for i, doc_id in enumerate(batch)}
+        placeholders = ", ".join(f":{name}" for name in params)
+        db.session.execute(
+            text(f"DELETE FROM search_index WHERE {key} IN ({placeholders})"), params
+        )
+
+
+def build_query(q):
+    """Turn free text into a safe match expression (all terms, last one as prefix)."""
+    tokens = TOKEN_RE.findall(q.lower())[:10]
+    if not tokens:
+        return None
+    if dialect() == "sqlite":
+        terms = [f'"{t}"' for t in tokens]
+        terms[-1] += "*"
+        return " ".join(terms)
+    terms = list(tokens)
+    terms[-1] += ":*"
+    return " & ".join(terms)
+
+
+def search(q, category_id=None, after=None, limit=20):
+    """Ranked search with keyset pagination.
+
+    Scores are normalised so that lower is better on both backends, and the
+    cursor is ``(score, doc_id)`` of the last row of the previous page.
+    Returns ``(rows, next_cursor)``.
+    """
+    match = build_query(q)
+    if match is None:
+        return [], None
+
+    params = {"q": match, "limit": limit + 1}
+    filters = []
+    campus_id = tenancy.current_campus_id()
+    if campus_id is not None:
+        # The index is shared by all campuses
+        filters.append("post_id IN (SELECT id FROM post WHERE campus_id = :campus_id)")
+        params["campus_id"] = campus_id
+    if category_id:
+        filters.append("category_id = :category_id")
+        params["category_id"] = category_id
+    if after:
+        filters.append(
+            "(score > :after_score OR (score = :after_score AND doc_id > :after_id))"
+        )
+        params["after_score"], params["after_id"] = after
+
+    if dialect() == "sqlite":
+        inner = (
+            "SELECT rowid AS doc_id, kind, ref_id, post_id, category_id, content, "
+            "bm25(search_index) AS score FROM search_index "
+            "WHERE search_index MATCH :q"
+        )
+    else:
+        inner = (
+            "SELECT doc_id, kind, ref_id, post_id, category_id, content, "
+            "-ts_rank_cd(tsv, to_tsquery('english', :q)) AS score "
+            "FROM search_index WHERE tsv @@ to_tsquery('english', :q)"
+        )
+    where = f" WHERE {' AND '.join(filters)}" if filters else ""
+    sql = f"SELECT * FROM ({inner}) AS hits{where} ORDER BY score, doc_id LIMIT :limit"
+    rows = db.session.execute(text(sql), params).mappings().all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = f"{rows[-1]['score']!r},{rows[-1]['doc_id']}"
+    return rows, next_cursor
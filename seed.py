@@ -1,4 +1,7 @@
 from config import db
+import queries
+import ranking
+import search
 from app import app
 from models import Category, Comment, User, Post, Reaction, AdminResponse
 # Drop and create tables
@@ -110,3 +113,8 @@ with app.app_context():
    for resp in responses:
        db.session.add(resp)
    db.session.commit()
+
+
+   ranking.recount_posts()
+   queries.restamp_moderation_status()
+   search.init_search_index(rebuild=True)
@@ -0,0 +1,147 @@
+"""Campus (tenant) scoping.
+
+Each ``university_settings`` row is a campus. Users, categories, posts,
+security reports and escort requests carry its id in ``campus_id`` and
+everything else hangs off one of those. Every request is bound to one
+campus: a logged-in session to its user's campus, anonymous requests to
+the campus named by the ``X-Campus`` header (or ``?campus=``) slug, and to
+the default campus otherwise.
+
+While a request is bound, every ORM SELECT, UPDATE and DELETE touching a
+campus-scoped model gets ``campus_id = <campus>`` added to it, and new rows
+are stamped with the campus. Background jobs run outside requests and see
+all campuses; code inside a request that must too (login by email, flushing
+shared buffers, batch jobs) wraps itself in ``unscoped()``.
+"""
+
+from contextlib import contextmanager
+
+from flask import g, has_app_context, request, session
+from sqlalchemy import event
+from sqlalchemy.orm import with_loader_criteria
+
+from config import db
+from models import DEFAULT_CAMPUS_ID, CampusScoped, Category, UniversitySettings
+from replicas import RoutingSession
+
+_slugs = {}
+
+
+def current_campus_id():
+    """The request's campus, or None when queries are not scoped."""
+    return g.get("campus_id") if has_app_context() else None
+
+
+def request_campus_id():
+    """The campus to attribute new data to (the default outside requests)."""
+    return current_campus_id() or DEFAULT_CAMPUS_ID
+
+
+@contextmanager
+def unscoped():
+    previous = g.get("campus_id")
+    g.campus_id = None
+    try:
+        yield
+    finally:
+        g.campus_id = previous
+
+
+def bind_campus(campus_id):
+    """Bind the request to a campus found by other means (e.g. an API token)."""
+    g.campus_id = campus_id
+
+
+def campus_id_for(slug):
+    if slug not in _slugs:
+        campus_id = db.session.scalar(
+            db.select(UniversitySettings.id).where(UniversitySettings.slug == slug)
+        )
+        if campus_id is None:
+            return None
+        _slugs[slug] = campus_id
+    return _slugs[slug]
+
+
+def current_settings():
+    """The request's campus row, created with defaults if it is missing."""
+    campus_id = request_campus_id()
+    settings = db.session.get(UniversitySettings, campus_id)
+    if settings is None:
+        settings = UniversitySettings(id=campus_id, slug=f"campus-{campus_id}")
+        db.session.add(settings)
+        db.session.commit()
+    return settings
+
+
+def ensure_default_campus():
+    """Make sure campus 1 exists and every campus has a slug."""
+    if db.session.get(UniversitySettings, DEFAULT_CAMPUS_ID) is None:
+        db.session.add(UniversitySettings(id=DEFAULT_CAMPUS_ID, slug="default"))
+    for settings in UniversitySettings.query.filter(UniversitySettings.slug.is_(None)):
+        settings.slug = (
+            "default" if settings.id == DEFAULT_CAMPUS_ID else f"campus-{settings.id}"
+        )
+    db.session.commit()
+
+
+def create_campus(slug, name, copy_categories=True):
+    """Add a campus, seeded with the default campus's category names."""
+    campus = UniversitySettings(slug=slug, name=name)
+    db.session.add(campus)
+    db.session.flush()
+    if copy_categories:
+        with unscoped():
+            defaults = Category.query.filter_by(campus_id=DEFAULT_CAMPUS_ID).all()
+        db.session.add_all(
+            Category(name=c.name, description=c.description, campus_id=campus.id)
+            for c in defaults
+        )
+    db.session.commit()
+    return campus
+
+
+def _scope_statement(state):
+    campus_id = current_campus_id()
+    if campus_id is None:
+        return
+    if (
+        (state.is_select and not (state.is_column_load or state.is_relationship_load))
+        or state.is_update
+        or state.is_delete
+    ):
+        state.statement = state.statement.options(
+            with_loader_criteria(
+                CampusScoped,
+                lambda cls: cls.campus_id == campus_id,
+                include_aliases=True,
+            )
+        )
+
+
+def _stamp_new_rows(session, flush_context, instances):
+    campus_id = request_campus_id()
+    for obj in session.new:
+        if isinstance(obj, CampusScoped) and obj.campus_id is None:
+            obj.campus_id = campus_id
+
+
+def bind_request_campus():
+    if session.get("user_id"):
+        # Sessions from before tenancy belong to the default campus
+        g.campus_id = session.get("campus_id", DEFAULT_CAMPUS_ID)
+        return None
+    slug = request.headers.get("X-Campus") or request.args.get("campus")
+    if not slug:
+        g.campus_id = DEFAULT_CAMPUS_ID
+        return None
+    g.campus_id = campus_id_for(slug)
+    if g.campus_id is None:
+        return {"error": "Unknown campus"}, 404
+    return None
+
+
+def init_tenancy(app):
+    event.listen(RoutingSession, "do_orm_execute", _scope_statement)
+    event.listen(RoutingSession, "before_flush", _stamp_new_rows)
+    app.before_request(bind_request_campus)
@@ -0,0 +1,207 @@
+"""Hour-of-week incident trends without scanning ``security_report``.
+
+``incident_hour`` holds one counter per campus, report type and UTC hour.
+``create_security_report`` bumps it with a single upsert and account
+deletion takes the removed reports back out, so the table grows by at most
+one row per campus and type per hour. A query reads the counters for its
+range into a dense array with one slot per hour (a semester is about 3,000
+slots) and folds that into an hour-of-week profile, weekly totals and the
+week-over-week change.
+
+Weeks and hours of the week are in campus local time (CAMPUS_UTC_OFFSET)
+and start on Monday.
+"""
+
+from array import array
+from collections import Counter
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from config import CAMPUS_UTC_OFFSET, db
+from models import IncidentHour, SecurityReport
+
+EPOCH = datetime(1970, 1, 1)
+HOURS_PER_WEEK = 168
+# Longest range a trends request may ask for (a semester and then some); the
+# series is one slot per hour
+MAX_RANGE_DAYS = 140
+# 1970-01-01 was a Thursday; shifting by three days makes weeks start on Monday
+MONDAY_SHIFT = 3 * 24
+UPSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+
+def hour_index(ts):
+    return int((ts - EPOCH).total_seconds() // 3600)
+
+
+def _local_week(hour):
+    return (hour + CAMPUS_UTC_OFFSET + MONDAY_SHIFT) // HOURS_PER_WEEK
+
+
+def _week_start(week):
+    """Local date of the Monday that starts ``week``."""
+    return (EPOCH + timedelta(hours=week * HOURS_PER_WEEK - MONDAY_SHIFT)).date()
+
+
+def _add(counts):
+    rows = [
+        {"campus_id": c, "type": t, "hour": h, "count": n}
+        for (c, t, h), n in counts.items()
+    ]
+    if not rows:
+        return
+    upsert = UPSERTS.get(db.session.get_bind().dialect.name)
+    if upsert:
+        stmt = upsert(IncidentHour)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[
+                IncidentHour.campus_id,
+                IncidentHour.type,
+                IncidentHour.hour,
+            ],
+            set_={"count": IncidentHour.count + stmt.excluded.count},
+        )
+        db.session.execute(stmt, rows)
+        return
+    for row in rows:
+        updated = db.session.execute(
+            update(IncidentHour)
+            .where(
+                IncidentHour.campus_id == row["campus_id"],
+                IncidentHour.type == row["type"],
+                IncidentHour.hour == row["hour"],
+            )
+            .values(count=IncidentHour.count + row["count"])
+        )
+        if not updated.rowcount:
+            db.session.execute(insert(IncidentHour).values(**row))
+
+
+def record_report(campus_id, report_type, created_at):
+    """Count one new report (in the caller's transaction)."""
+    _add({(campus_id, report_type, hour_index(created_at)): 1})
+
+
+def record_reports(campus_id, reports):
+    """Count a batch of new (type, created_at) reports with one upsert."""
+    _add(Counter((campus_id, t, hour_index(c)) for t, c in reports))
+
+
+def forget_reports(where):
+    """Uncount the reports matching ``where`` before they are deleted."""
+    counts = Counter(
+        (c, t, hour_index(created_at))
+        for c, t, created_at in db.session.execute(
+            select(
+                SecurityReport.campus_id, SecurityReport.type, SecurityReport.created_at
+            ).where(where)
+        )
+        if created_at is not None
+    )
+    if not counts:
+        return
+    table = IncidentHour.__table__
+    db.session.execute(
+        update(table)
+        .where(
+            table.c.campus_id == bindparam("c"),
+            table.c.type == bindparam("t"),
+            table.c.hour == bindparam("h"),
+        )
+        .values(count=table.c.count - bindparam("n")),
+        [{"c": c, "t": t, "h": h, "n": n} for (c, t, h), n in counts.items()],
+    )
+
+
+def backfill():
+    """Fill an empty counter table from existing reports (one pass, once)."""
+    if db.session.scalar(select(IncidentHour.hour).limit(1)) is not None:
+        return 0
+    counts = Counter()
+    rows = db.session.execute(
+        select(
+            SecurityReport.campus_id, SecurityReport.type, SecurityReport.created_at
+        ).execution_options(yield_per=5000)
+    )
+    for campus_id, report_type, created_at in rows:
+        if created_at is not None:
+            counts[(campus_id, report_type, hour_index(created_at))] += 1
+    _add(counts)
+    db.session.commit()
+    return sum(counts.values())
+
+
+def hourly_series(campus_id, start_hour, end_hour, report_type=None):
+    """Counts for each UTC hour in [start_hour, end_hour), zeros included."""
+    query = (
+        select(IncidentHour.hour, func.sum(IncidentHour.count))
+        .where(
+            IncidentHour.campus_id == campus_id,
+            IncidentHour.hour >= start_hour,
+            IncidentHour.hour < end_hour,
+        )
+        .group_by(IncidentHour.hour)
+    )
+    if report_type:
+        query = query.where(IncidentHour.type == report_type)
+    series = array("l", [0]) * (end_hour - start_hour)
+    for hour, count in db.session.execute(query):
+        series[hour - start_hour] = count
+    return series
+
+
+def incident_trends(campus_id, report_type=None, start=None, end=None, now=None):
+    """Hour-of-week profile and weekly totals between two UTC datetimes."""
+    now = now or datetime.utcnow()
+    end_hour = hour_index(end or now) + (0 if end else 1)
+    start_hour = hour_index(start) if start else end_hour - 12 * HOURS_PER_WEEK
+    series = hourly_series(campus_id, start_hour, end_hour, report_type)
+
+    hour_of_week = [0] * HOURS_PER_WEEK
+    weekly = Counter()
+    for offset, count in enumerate(series):
+        if count:
+            hour = start_hour + offset
+            local = hour + CAMPUS_UTC_OFFSET + MONDAY_SHIFT
+            hour_of_week[local % HOURS_PER_WEEK] += count
+            weekly[_local_week(hour)] += count
+
+    # Last 7 days against the 7 before, independent of the requested range
+    now_hour = hour_index(now) + 1
+    recent = hourly_series(
+        campus_id, now_hour - 2 * HOURS_PER_WEEK, now_hour, report_type
+    )
+    this_week = sum(recent[HOURS_PER_WEEK:])
+    last_week = sum(recent[:HOURS_PER_WEEK])
+
+    first_week, last_week_index = _local_week(start_hour), _local_week(end_hour - 1)
+    return {
+        "type": report_type,
+        "start": EPOCH + timedelta(hours=start_hour),
+        "end": EPOCH + timedelta(hours=end_hour),
+        "total": sum(hour_of_week),
+        # Monday first, 24 local hours per day
+        "hour_of_week": [hour_of_week[d * 24 : d * 24 + 24] for d in range(7)],
+        "weekly": [
+            {"week_start": _week_start(w), "count": weekly[w]}
+            for w in range(first_week, last_week_index + 1)
+        ],
+        "week_over_week": {
+            "this_week": this_week,
+            "last_week": last_week,
+            "change": (
+                round((this_week - last_week) / last_week, 3) if last_week else None
+            ),
+        },
+    }
+
+
+def report_types(campus_id):
+    return db.session.scalars(
+        select(IncidentHour.type)
+        .where(IncidentHour.campus_id == campus_id)
+        .distinct()
+        .order_by(IncidentHour.type)
+    ).all()
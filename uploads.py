@@ -0,0 +1,214 @@
+"""Image uploads: content-addressed storage with pre-rendered variants.
+
+An upload is identified by the hash of its bytes, so the same photo
+uploaded twice is stored (and processed) once. Decoding and resizing run
+in a process pool, off the request thread; the upload returns the id as
+soon as the source is on disk and a variant request that arrives before
+rendering finishes waits for it.
+
+Variants are WebP, EXIF-rotated and stripped of metadata (phone photos
+carry GPS coordinates), and live under
+``IMAGE_DIR/<id[:2]>/<id>/<variant>.webp``. The source file is deleted
+once they are rendered. Their URLs never change content, so they are
+served with immutable cache headers.
+
+Posts and comments store image ids in their ``images`` column; values that
+are not ids are URLs from before uploads existed and are passed through.
+"""
+
+import base64
+import binascii
+import hashlib
+import logging
+import multiprocessing
+import os
+import re
+import shutil
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # optional dependency
+    Image = None
+else:
+    # Refuse decompression bombs rather than only warning
+    Image.MAX_IMAGE_PIXELS = 50_000_000
+
+IMAGE_DIR = os.path.abspath(os.getenv("IMAGE_DIR", "uploads"))
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(10 * 1024 * 1024)))
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+IMAGE_QUALITY = 80
+# Longest edge in pixels; rendered in this order
+IMAGE_VARIANTS = {"thumb": 320, "feed": 1080, "full": 2048}
+FEED_VARIANT = "feed"
+IMAGE_MAX_AGE = 365 * 24 * 3600
+
+IMAGE_ID = re.compile(r"^[0-9a-f]{32}$")
+DATA_URL = re.compile(r"^data:image/[\w.+-]+;base64,", re.IGNORECASE)
+MAGIC = (b"\xff\xd8\xff", b"\x89PNG\r\n\x1a\n", b"GIF87a", b"GIF89a")
+
+logger = logging.getLogger(__name__)
+
+
+class UploadError(ValueError):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def render_variants(source, out_dir):
+    """Runs in a worker process: write every variant of ``source`` to out_dir."""
+    with Image.open(source) as im:
+        im = ImageOps.exif_transpose(im)
+        has_alpha = im.mode in ("RGBA", "LA", "PA") or "transparency" in im.info
+        im = im.convert("RGBA" if has_alpha else "RGB")
+        for name, size in IMAGE_VARIANTS.items():
+            variant = im.copy()
+            variant.thumbnail((size, size), Image.LANCZOS)
+            tmp = os.path.join(out_dir, f".{name}.tmp")
+            variant.save(tmp, "WEBP", quality=IMAGE_QUALITY, method=4)
+            os.replace(tmp, os.path.join(out_dir, f"{name}.webp"))
+    os.remove(source)
+
+
+def image_dir(image_id):
+    return os.path.join(IMAGE_DIR, image_id[:2], image_id)
+
+
+def variant_path(image_id, variant):
+    return os.path.join(image_dir(image_id), f"{variant}.webp")
+
+
+def is_image_id(value):
+    return isinstance(value, str) and IMAGE_ID.match(value) is not None
+
+
+def image_url(value, variant=FEED_VARIANT):
+    return f"/api/images/{value}/{variant}" if is_image_id(value) else value
+
+
+def image_urls(values, variant=FEED_VARIANT):
+    """Stored ``images`` column -> URLs for the response."""
+    return [image_url(v, variant) for v in values or []]
+
+
+_executor = None
+_pending = {}
+_lock = threading.Lock()
+
+
+def start_image_workers():
+    """Start the worker processes; call before anything starts a thread.
+
+    Workers are forked rather than spawned: a spawned child re-runs the main
+    module, which for ``python app.py`` is the whole app startup. A pool
+    replaced after a crash is forked from the threaded app, which is safe
+    as long as the workers only render images and never log.
+    """
+    global _executor
+    if Image is None:
+        return
+    method = "fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn"
+    _executor = ProcessPoolExecutor(
+        max_workers=IMAGE_WORKERS, mp_context=multiprocessing.get_context(method)
+    )
+    # The first submit starts the whole pool
+    _executor.submit(os.getpid)
+
+
+def _submit(*args):
+    if _executor is None:
+        start_image_workers()
+    try:
+        return _executor.submit(*args)
+    except BrokenProcessPool:
+        # A worker died (e.g. killed for memory); replace the pool once
+        start_image_workers()
+        return _executor.submit(*args)
+
+
+def _rendered(image_id, future):
+    with _lock:
+        _pending.pop(image_id, None)
+    if future.exception() is not None:
+        logger.warning("Processing image %s failed: %s", image_id, future.exception())
+        shutil.rmtree(image_dir(image_id), ignore_errors=True)
+
+
+def _stored(image_id):
+    # Rendered, or its source is waiting for a worker (possibly another process)
+    directory = image_dir(image_id)
+    return os.path.exists(
+        os.path.join(directory, f"{list(IMAGE_VARIANTS)[-1]}.webp")
+    ) or os.path.exists(os.path.join(directory, ".source"))
+
+
+def exists(image_id):
+    if not is_image_id(image_id):
+        return False
+    with _lock:
+        return image_id in _pending or _stored(image_id)
+
+
+def store(data):
+    """Store an uploaded image and queue its variants; returns the image id."""
+    if Image is None:
+        raise UploadError("Image processing is not available", 503)
+    if len(data) > IMAGE_MAX_BYTES:
+        raise UploadError("Image is too large", 413)
+    if not (data.startswith(MAGIC) or data[:4] == b"RIFF" and data[8:12] == b"WEBP"):
+        raise UploadError("Unsupported image type", 415)
+
+    image_id = hashlib.blake2b(data, digest_size=16).hexdigest()
+    with _lock:
+        if image_id in _pending or _stored(image_id):
+            return image_id
+        out_dir = image_dir(image_id)
+        os.makedirs(out_dir, exist_ok=True)
+        source = os.path.join(out_dir, ".source")
+        with open(source + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(source + ".tmp", source)
+        future = _submit(render_variants, source, out_dir)
+        _pending[image_id] = future
+    future.add_done_callback(partial(_rendered, image_id))
+    return image_id
+
+
+def store_data_url(value):
+    """Move a ``data:image/...;base64,`` URL into storage; returns the image id."""
+    try:
+        data = base64.b64decode(DATA_URL.sub("", value, count=1), validate=True)
+    except binascii.Error:
+        raise UploadError("Invalid image data")
+    return store(data)
+
+
+def normalize(value):
+    """An ``image`` field from a post/comment body -> the value to store."""
+    if not value:
+        return None
+    if not isinstance(value, str):
+        raise UploadError("image must be a string")
+    if is_image_id(value):
+        if not exists(value):
+            raise UploadError("Unknown image id")
+        return value
+    if DATA_URL.match(value):
+        return store_data_url(value)
+    return value
+
+
+def wait_for(image_id, timeout=30):
+    """Block until a queued image has been rendered (or failed)."""
+    with _lock:
+        future = _pending.get(image_id)
+    if future is None:
+        return
+    try:
+        future.result(timeout=timeout)
+    except Exception:  # failures are logged by _rendered
+        pass
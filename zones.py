@@ -0,0 +1,211 @@
+"""Campus zones and the point-in-polygon lookup that assigns rows to them.
+
+Admins draw zones (dorms, library, parking...) as polygons of
+``[latitude, longitude]`` vertices within ZONE_MAX_RADIUS_M of the campus
+center. Each worker keeps a campus's zones in a grid index: every cell of
+ZONE_CELL_DEGREES lists the zones whose bounding box overlaps it, so a
+lookup ray-casts only against the few polygons near the point. Where zones
+overlap, the smallest one wins.
+
+Security reports and escort requests are stamped with their zone when they
+are created. Saving or deleting a zone re-stamps the rows it can affect
+(those inside its old or new bounding box). Other workers reload a
+campus's zones after ZONE_REFRESH_SECONDS, so rows they create in that
+window may carry the old assignment; ``flask --app app restamp-zones``
+recomputes every row.
+"""
+
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+
+from sqlalchemy import or_, select, update
+
+from config import db
+from models import EscortRequest, SecurityReport, Zone
+import tenancy
+
+ZONE_CELL_DEGREES = float(os.getenv("ZONE_CELL_DEGREES", "0.002"))
+ZONE_MAX_RADIUS_M = float(os.getenv("ZONE_MAX_RADIUS_M", "10000"))
+ZONE_REFRESH_SECONDS = int(os.getenv("ZONE_REFRESH_SECONDS", "30"))
+ZONE_MAX_VERTICES = 200
+METERS_PER_DEGREE = 111_320
+STAMPED_MODELS = (SecurityReport, EscortRequest)
+BATCH_SIZE = 1000
+
+
+def parse_polygon(value, center=None):
+    """Validate a ``[[lat, lon], ...]`` polygon; raises ValueError."""
+    if not isinstance(value, list) or not 3 <= len(value) <= ZONE_MAX_VERTICES:
+        raise ValueError(
+            f"polygon must be a list of 3 to {ZONE_MAX_VERTICES} [lat, lon] points"
+        )
+    points = []
+    for point in value:
+        if (
+            not isinstance(point, list)
+            or len(point) != 2
+            or any(
+                isinstance(v, bool) or not isinstance(v, (int, float)) for v in point
+            )
+            or not (-90 <= point[0] <= 90 and -180 <= point[1] <= 180)
+        ):
+            raise ValueError("polygon points must be [latitude, longitude] numbers")
+        points.append([float(point[0]), float(point[1])])
+    if center is not None and any(
+        distance_m(center, point) > ZONE_MAX_RADIUS_M for point in points
+    ):
+        raise ValueError(
+            f"zones must lie within {ZONE_MAX_RADIUS_M:g} m of the campus center"
+        )
+    if area(points) == 0:
+        raise ValueError("polygon has no area")
+    return points
+
+
+def parse_point(data):
+    """(latitude, longitude) floats from a request body; raises ValueError."""
+    point = []
+    for name, limit in (("latitude", 90), ("longitude", 180)):
+        value = data.get(name)
+        if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+            raise ValueError(f"{name} must be a number")
+        try:
+            value = float(value)
+        except ValueError:
+            raise ValueError(f"{name} must be a number")
+        # NaN fails the comparison too
+        if not -limit <= value <= limit:
+            raise ValueError(f"{name} is out of range")
+        point.append(value)
+    return tuple(point)
+
+
+def distance_m(a, b):
+    """Equirectangular distance in meters; plenty at campus scale."""
+    dx = (b[1] - a[1]) * math.cos(math.radians((a[0] + b[0]) / 2))
+    return math.hypot(b[0] - a[0], dx) * METERS_PER_DEGREE
+
+
+def area(polygon):
+    """Shoelace area in square degrees, only used to rank overlapping zones."""
+    edges = zip(polygon, polygon[1:] + polygon[:1])
+    return abs(sum(a[0] * b[1] - b[0] * a[1] for a, b in edges)) / 2
+
+
+def bounding_box(polygon):
+    lats = [p[0] for p in polygon]
+    lons = [p[1] for p in polygon]
+    return min(lats), min(lons), max(lats), max(lons)
+
+
+def contains(polygon, lat, lon):
+    """Ray casting: does the polygon contain the point?"""
+    inside = False
+    for (lat_a, lon_a), (lat_b, lon_b) in zip(polygon, polygon[-1:] + polygon[:-1]):
+        if (lat_a > lat) != (lat_b > lat):
+            # Longitude where this edge crosses the point's latitude
+            crossing = lon_a + (lat - lat_a) * (lon_b - lon_a) / (lat_b - lat_a)
+            if lon < crossing:
+                inside = not inside
+    return inside
+
+
+def _cell(value):
+    return math.floor(value / ZONE_CELL_DEGREES)
+
+
+class ZoneGrid:
+    """The zones of one campus, bucketed by grid cell."""
+
+    def __init__(self, zones):
+        self.cells = defaultdict(list)
+        self.loaded_at = time.monotonic()
+        # Smallest first, so the first hit in a cell is the most specific zone
+        for zone_id, polygon in sorted(zones, key=lambda z: area(z[1])):
+            box = bounding_box(polygon)
+            for x in range(_cell(box[0]), _cell(box[2]) + 1):
+                for y in range(_cell(box[1]), _cell(box[3]) + 1):
+                    self.cells[(x, y)].append((zone_id, polygon, box))
+
+    def lookup(self, lat, lon):
+        for zone_id, polygon, box in self.cells.get((_cell(lat), _cell(lon)), ()):
+            if (
+                box[0] <= lat <= box[2]
+                and box[1] <= lon <= box[3]
+                and contains(polygon, lat, lon)
+            ):
+                return zone_id
+        return None
+
+
+_grids = {}
+_lock = threading.Lock()
+
+
+def grid(campus_id):
+    entry = _grids.get(campus_id)
+    if entry is None or time.monotonic() - entry.loaded_at > ZONE_REFRESH_SECONDS:
+        with tenancy.unscoped():
+            rows = db.session.execute(
+                select(Zone.id, Zone.polygon).where(Zone.campus_id == campus_id)
+            ).all()
+        entry = ZoneGrid(rows)
+        with _lock:
+            _grids[campus_id] = entry
+    return entry
+
+
+def invalidate(campus_id):
+    with _lock:
+        _grids.pop(campus_id, None)
+
+
+def zone_for(campus_id, lat, lon):
+    """The id of the zone containing the point, or None."""
+    if lat is None or lon is None:
+        return None
+    return grid(campus_id).lookup(lat, lon)
+
+
+def restamp(campus_id, zone_ids=(), boxes=None):
+    """Recompute zone_id for rows in ``boxes`` or assigned to ``zone_ids``.
+
+    With ``boxes=None`` every row of the campus is recomputed. Does not
+    commit; returns the number of rows whose zone changed.
+    """
+    invalidate(campus_id)
+    index = grid(campus_id)
+    changed = 0
+    with tenancy.unscoped():
+        for model in STAMPED_MODELS:
+            query = select(model.id, model.latitude, model.longitude, model.zone_id)
+            query = query.where(model.campus_id == campus_id)
+            if boxes is not None:
+                query = query.where(
+                    or_(
+                        model.zone_id.in_(zone_ids),
+                        *(
+                            model.latitude.between(box[0], box[2])
+                            & model.longitude.between(box[1], box[3])
+                            for box in boxes
+                        ),
+                    )
+                )
+            moves = defaultdict(list)
+            for row_id, lat, lon, zone_id in db.session.execute(query).all():
+                new_zone = index.lookup(lat, lon)
+                if new_zone != zone_id:
+                    moves[new_zone].append(row_id)
+            for new_zone, ids in moves.items():
+                for start in range(0, len(ids), BATCH_SIZE):
+                    db.session.execute(
+                        update(model)
+                        .where(model.id.in_(ids[start : start + BATCH_SIZE]))
+                        .values(zone_id=new_zone)
+                        .execution_options(synchronize_session=False)
+                    )
+                changed += len(ids)
+    return changed